@@ -8,13 +8,16 @@ from datetime import datetime
 # Call functions from parent utils.py file
 utils_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 sys.path.insert(0, utils_dir) 
-from utils import adjust_descriptive_count, count_words, determine_affiliation, retrieve_crossref 
+from utils import AffiliationMatcher, configure_session, determine_affiliation, http_settings_from_env, map_unique, retrieve_crossref, score_titles, standardize_rights 
 
 #read in env file
 parent = os.path.abspath(os.path.join(os.getcwd(), '..'))
 with open(f'{parent}/env.json', 'r') as file:
     env = json.load(file)
 
+#shared connection-pooled HTTP session for all API calls
+configure_session(http_settings_from_env(env))
+
 #operator for quick test runs
 test = env['TOGGLES']['test']
 #operator for resource type(s) to query for (use '|' for Boolean OR)
@@ -28,6 +31,7 @@ today_date = datetime.now().strftime('%Y%m%d')
 
 #load institutional name permutations
 ut_variations = env['PERMUTATIONS']
+affiliation_matcher = AffiliationMatcher(ut_variations)
 #load institution string for filenames
 institution = env['INSTITUTION']['filename']
 
@@ -72,9 +76,7 @@ else:
 #defining some metadata assessment objects
 ##assess 'descriptiveness of dataset title'
 words = env['WORDS']
-###add integers
-numbers = list(map(str, range(1, 1000000)))
-###combine all into a single set
+###combine all into a single set (whole numbers are recognized by pattern in score_titles)
 nondescriptive_words = set(
     words['articles'] +
     words['conjunctions'] +
@@ -83,8 +85,7 @@ nondescriptive_words = set(
     words['possessives'] +
     words['descriptors'] +
     words['order'] +
-    words['version'] +
-    numbers
+    words['version']
 )
 
 print("Starting Crossref retrieval.\n")
@@ -189,23 +190,17 @@ df_data_select_crossref = pd.DataFrame(data_select_crossref)
 df_data_select_crossref_deduplicated = df_data_select_crossref.drop_duplicates(subset='doi', keep='first')
 
 #creating column for source of detected affiliation
-pattern = '|'.join([f'({perm})' for perm in ut_variations])
 df_data_select_crossref_deduplicated['affiliation_source'] = df_data_select_crossref_deduplicated.apply(
-    lambda row: 'affiliation' if pd.Series(row['creators_affiliations']).str.contains(pattern, case=False, na=False).any()
-    else ('author' if pd.Series(row['creators_names']).str.contains(pattern, case=False, na=False).any()
+    lambda row: 'affiliation' if affiliation_matcher.filter(row['creators_affiliations'])
+    else ('author' if affiliation_matcher.filter(row['creators_names'])
     else None), axis=1)
-df_data_select_crossref_deduplicated['affiliation_permutation'] = df_data_select_crossref_deduplicated['creators_affiliations'].apply(
-    lambda affs: next((p for p in ut_variations if any(p in aff for aff in affs)), None)
-)
+df_data_select_crossref_deduplicated['affiliation_permutation'] = df_data_select_crossref_deduplicated['creators_affiliations'].map(affiliation_matcher.first_permutation)
 
 #select metadata assessment
 ##titles
 df_data_select_crossref_deduplicated['title_reformatted'] = df_data_select_crossref_deduplicated['title'].str.replace('_', ' ') #gets around text linked by underscores counting as 1 word
 df_data_select_crossref_deduplicated['title_reformatted'] = df_data_select_crossref_deduplicated['title_reformatted'].str.lower()
-df_data_select_crossref_deduplicated[['total_word_count_title', 'descriptive_word_count_title']] = df_data_select_crossref_deduplicated['title_reformatted'].apply(lambda x: pd.Series(count_words(x, nondescriptive_words)))
-
-df_data_select_crossref_deduplicated['descriptive_word_count_title'] = df_data_select_crossref_deduplicated.apply(adjust_descriptive_count, axis=1)
-df_data_select_crossref_deduplicated['nondescriptive_word_count_title'] = df_data_select_crossref_deduplicated['total_word_count_title'] - df_data_select_crossref_deduplicated['descriptive_word_count_title']
+df_data_select_crossref_deduplicated[['total_word_count_title', 'descriptive_word_count_title', 'nondescriptive_word_count_title']] = score_titles(df_data_select_crossref_deduplicated['title_reformatted'], nondescriptive_words)
 
 ##licenses
 ###Note: most Crossref datasets don't have any licensing information
@@ -215,22 +210,7 @@ df_data_select_crossref_deduplicated['rights'] = (
                      else str(x) if pd.notnull(x)
                      else '').str.strip('[]')
 )
-df_data_select_crossref_deduplicated['rights_standardized'] = 'Rights unclear'  #default value
-df_data_select_crossref_deduplicated.loc[df_data_select_crossref_deduplicated['rights'].str.contains('Creative Commons Zero|CC0'), 'rights_standardized'] = 'CC0'
-df_data_select_crossref_deduplicated.loc[df_data_select_crossref_deduplicated['rights'].str.contains('Creative Commons Attribution Non Commercial Share Alike'), 'rights_standardized'] = 'CC BY-NC-SA'
-df_data_select_crossref_deduplicated.loc[df_data_select_crossref_deduplicated['rights'].str.contains('Creative Commons Attribution Non Commercial'), 'rights_standardized'] = 'CC BY-NC'
-df_data_select_crossref_deduplicated.loc[df_data_select_crossref_deduplicated['rights'].str.contains('Creative Commons Attribution 3.0|Creative Commons Attribution 4.0|Creative Commons Attribution-NonCommercial'), 'rights_standardized'] = 'CC BY'
-df_data_select_crossref_deduplicated.loc[df_data_select_crossref_deduplicated['rights'].str.contains('GNU General Public License'), 'rights_standardized'] = 'GNU GPL'
-df_data_select_crossref_deduplicated.loc[df_data_select_crossref_deduplicated['rights'].str.contains('Apache License'), 'rights_standardized'] = 'Apache'
-df_data_select_crossref_deduplicated.loc[df_data_select_crossref_deduplicated['rights'].str.contains('MIT License'), 'rights_standardized'] = 'MIT'
-df_data_select_crossref_deduplicated.loc[df_data_select_crossref_deduplicated['rights'].str.contains('BSD'), 'rights_standardized'] = 'BSD'
-df_data_select_crossref_deduplicated.loc[df_data_select_crossref_deduplicated['rights'].str.contains('ODC-BY'), 'rights_standardized'] = 'ODC-BY'
-df_data_select_crossref_deduplicated.loc[df_data_select_crossref_deduplicated['rights'].str.contains('Open Access'), 'rights_standardized'] = 'Rights unclear'
-df_data_select_crossref_deduplicated.loc[df_data_select_crossref_deduplicated['rights'].str.contains('Closed Access'), 'rights_standardized'] = 'Restricted access'
-df_data_select_crossref_deduplicated.loc[df_data_select_crossref_deduplicated['rights'].str.contains('Restricted Access'), 'rights_standardized'] = 'Restricted access'
-df_data_select_crossref_deduplicated.loc[df_data_select_crossref_deduplicated['rights'].str.contains('Databrary'), 'rights_standardized'] = 'Custom terms'
-df_data_select_crossref_deduplicated.loc[df_data_select_crossref_deduplicated['rights'].str.contains('UCAR'), 'rights_standardized'] = 'Custom terms'
-df_data_select_crossref_deduplicated.loc[df_data_select_crossref_deduplicated['rights'] == '', 'rights_standardized'] = 'Rights unclear'
+df_data_select_crossref_deduplicated['rights_standardized'] = standardize_rights(df_data_select_crossref_deduplicated['rights']) #see LICENSE_RULES in utils.py
 
 df_data_select_crossref_deduplicated.to_csv(f"accessory-outputs/{today_date}_crossref-all-objects.csv", index=False)
 
@@ -250,7 +230,7 @@ print(repo_count)
 # df_data_select_crossref_pruned = df_data_select_crossref_true[['repository', 'doi', 'publicationYear', 'publicationDate', 'title', 'creators_names', 'creators_affiliations', 'creators_formatted', 'contributors_names', 'contributors_affiliations', 'contributors_formatted', 'first_author', 'first_affiliation', 'last_author', 'last_affiliation', 'source', 'type']] 
 df_data_select_crossref_pruned = df_data_select_crossref_true
 #adding columns for harmonizing with DataCite output
-df_data_select_crossref_pruned['uni_lead'] = df_data_select_crossref_pruned.apply(lambda row: determine_affiliation(row, ut_variations), axis=1)
+df_data_select_crossref_pruned['uni_lead'] = map_unique(df_data_select_crossref_pruned[['first_author', 'last_author', 'first_affiliation', 'last_affiliation']], lambda row: determine_affiliation(row, affiliation_matcher))
 df_data_select_crossref_pruned['repository2'] = 'Other'
 df_data_select_crossref_pruned['non_TDR_IR'] = 'not university or TDR'
 df_data_select_crossref_pruned['US_federal'] = 'not federal US repo'
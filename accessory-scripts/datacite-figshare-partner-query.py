@@ -8,13 +8,16 @@ import sys
 #call functions from parent utils.py file
 utils_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 sys.path.insert(0, utils_dir) 
-from utils import retrieve_datacite, retrieve_openalex 
+from utils import configure_session, http_get, http_settings_from_env, retrieve_datacite, retrieve_openalex 
 
 #read in env file
 parent = os.path.abspath(os.path.join(os.getcwd(), '..'))
 with open(f'{parent}/env.json', 'r') as file:
     env = json.load(file)
 
+#shared connection-pooled HTTP session for all API calls
+configure_session(http_settings_from_env(env))
+
 #operator for quick test runs
 test = env['TOGGLES']['test']
 #toggles for executing Figshare validator (see README for details)
@@ -209,7 +212,7 @@ if figshare_validator:
     results = []
     for id in figshare['id']:
         try:
-            response = requests.get(url_figshare.format(id=id))
+            response = http_get(url_figshare.format(id=id))
             if response.status_code == 200:
                 print(f'Retrieving {id}\n')
                 results.append({'id': id, 'data': response.json()})
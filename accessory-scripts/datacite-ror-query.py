@@ -9,13 +9,16 @@ import sys
 #call functions from parent utils.py file
 utils_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 sys.path.insert(0, utils_dir) 
-from utils import retrieve_datacite 
+from utils import configure_session, http_settings_from_env, retrieve_datacite 
 
 #read in env file
 parent = os.path.abspath(os.path.join(os.getcwd(), '..'))
 with open(f'{parent}/env.json', 'r') as file:
     env = json.load(file)
 
+#shared connection-pooled HTTP session for all API calls
+configure_session(http_settings_from_env(env))
+
 #operator for quick test runs
 test = env['TOGGLES']['test']
 #setting timestamp to calculate run time
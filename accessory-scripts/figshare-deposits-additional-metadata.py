@@ -3,12 +3,21 @@ import json
 import pandas as pd
 import os
 import requests
+import sys
+
+#call functions from parent utils.py file
+utils_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, utils_dir) 
+from utils import configure_session, http_get, http_settings_from_env 
 
 #read in env file
 parent = os.path.abspath(os.path.join(os.getcwd(), '..'))
 with open(f'{parent}/env.json', 'r') as file:
     env = json.load(file)
 
+#shared connection-pooled HTTP session for all API calls
+configure_session(http_settings_from_env(env))
+
 #creating variable with current date for appending to filenames
 today_date = datetime.now().strftime('%Y%m%d') 
 
@@ -59,7 +68,7 @@ print('Retrieving additional Figshare metadata from Figshare API\n')
 results = []
 for id in figshare['id']:
     try:
-        response = requests.get(url_figshare.format(id=id))
+        response = http_get(url_figshare.format(id=id))
         if response.status_code == 200:
             print(f'Retrieving record #{id}\n')
             results.append({'id': id, 'data': response.json()})
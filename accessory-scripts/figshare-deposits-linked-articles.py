@@ -1,9 +1,14 @@
 import os
 import json
 import pandas as pd
-import requests
+import sys
 from datetime import datetime
 
+#call functions from parent utils.py file
+utils_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, utils_dir) 
+from utils import configure_session, http_settings_from_env, retrieve_dois 
+
 #setting timestamp to calculate run time
 start_time = datetime.now() 
 #creating variable with current date for appending to filenames
@@ -17,7 +22,13 @@ url_datacite = 'https://api.datacite.org/dois'
 parent = os.path.abspath(os.path.join(os.getcwd(), '..'))
 with open(f'{parent}/env.json', 'r') as file:
     env = json.load(file)
+
+#shared connection-pooled HTTP session for all API calls
+configure_session(http_settings_from_env(env))
+
 institution = env['INSTITUTION']['filename']
+#number of DOI lookups kept in flight
+max_concurrency_doi_lookups = env['VARIABLES'].get('CONCURRENCY', {}).get('doi_lookups', 1)
 
 #for reading in previously generated file of all discovered datasets
 ##this includes datasets published through mediated workflows in which 'figshare' is not listed as the 'publisher'
@@ -61,17 +72,7 @@ print(f'Number of Figshare datasets to query: {len(figshare)}\n')
 figshare['doi_check'] = figshare['doi'].str.split(';').str[0]
 
 print('Retrieving additional DataCite metadata for affiliated Figshare deposits\n')
-results = []
-for doi in figshare['doi_check']:
-    try:
-        response = requests.get(f'{url_datacite}/{doi}')
-        if response.status_code == 200:
-            print(f'Retrieving {doi}\n')
-            results.append(response.json())
-        else:
-            print(f'Error retrieving {doi}: {response.status_code}, {response.text}')
-    except requests.exceptions.RequestException as e:
-        print(f'Timeout error on DOI {doi}: {e}')
+results = retrieve_dois(url_datacite, figshare['doi_check'], max_concurrency_doi_lookups)
 
 data_datacite_new = {
     'datasets': results
@@ -144,18 +145,7 @@ df_datacite_new.to_csv(f"accessory-outputs/{today_date}_{institution}-affiliated
 
 #retrieving metadata about related identifiers (linked articles) that were identified
 print("Retrieving metadata about related articles from Crossref\n")
-results = []
-for doi in df_datacite_new['related_identifier']:
-    try:
-        response = requests.get(f'{url_crossref}/{doi}')
-        if response.status_code == 200:
-            print(f"Retrieving {doi}")
-            print()
-            results.append(response.json())
-        else:
-            print(f"Error fetching {doi}: {response.status_code}, {response.text}")
-    except requests.exceptions.RequestException as e:
-        print(f"Timeout error on DOI {doi}: {e}")
+results = retrieve_dois(url_crossref.rstrip('/'), df_datacite_new['related_identifier'], max_concurrency_doi_lookups)
 
 data_figshare_crossref = {
     'articles': results
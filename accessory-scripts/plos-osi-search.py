@@ -5,10 +5,16 @@ import math
 import numpy as np
 import os
 import re
+import sys
 import zipfile
 from datetime import datetime
 from pathlib import Path
 
+#call functions from parent utils.py file
+utils_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, utils_dir) 
+from utils import configure_session, http_get, http_settings_from_env 
+
 #setting timestamp at start of script to calculate run time
 start_time = datetime.now() 
 #creating variable with current date for appending to filenames
@@ -19,6 +25,9 @@ parent = os.path.abspath(os.path.join(os.getcwd(), '..'))
 with open(f'{parent}/env.json', 'r') as file:
     env = json.load(file)
 
+#shared connection-pooled HTTP session for all API calls
+configure_session(http_settings_from_env(env))
+
 #create directory for PLOS data
 if os.path.isdir("inputs"):
         print("inputs directory found - no need to recreate")
@@ -41,7 +50,7 @@ figshare_url = 'https://api.figshare.com/v2'
 
 file_info = [] #a blank list to hold all the file metadata
 
-r = requests.get(figshare_url + '/articles/' + str(item_id) + '/files')
+r = http_get(figshare_url + '/articles/' + str(item_id) + '/files')
 file_metadata = json.loads(r.text)
 for j in file_metadata: #add the item id to each file record- this is used later to name a folder to save the file to
     j['item_id'] = item_id
@@ -49,10 +58,11 @@ for j in file_metadata: #add the item id to each file record- this is used later
 
 #Download each file to a subfolder named for the article id and save with the file name
 for k in file_info:
-    response = requests.get(figshare_url + '/file/download/' + str(k['id']), headers=None)
+    response = http_get(figshare_url + '/file/download/' + str(k['id']), stream=True)
     Path('inputs/' + str(k['item_id'])).mkdir(parents=True, exist_ok=True)
     with open('inputs/' + str(k['item_id']) + '/' + k['name'], 'wb') as f:
-        f.write(response.content)
+        for chunk in response.iter_content(chunk_size=1024 * 1024):
+            f.write(chunk)
 
 zip_file_directory = f'inputs/{item_id}'
 target_directory = 'inputs'
@@ -121,7 +131,7 @@ params_openalex = {
 ##retrieves a single page of results
 def retrieve_page_openalex(url, params=None):
     try:
-        response = requests.get(url, params=params)
+        response = http_get(url, params=params)
         response.raise_for_status()  
         return response.json()
     except requests.RequestException as e:
@@ -10,13 +10,16 @@ import sys
 #call functions from parent utils.py file
 utils_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 sys.path.insert(0, utils_dir) 
-from utils import retrieve_openalex 
+from utils import configure_session, http_get, http_settings_from_env, retrieve_openalex 
 
 #read in env file
 parent = os.path.abspath(os.path.join(os.getcwd(), '..'))
 with open(f'{parent}/env.json', 'r') as file:
     env = json.load(file)
 
+#shared connection-pooled HTTP session for all API calls
+configure_session(http_settings_from_env(env))
+
 #operator for quick test runs
 test = env['TOGGLES']['test']
 #setting timestamp to calculate run time
@@ -101,7 +104,7 @@ all_articles = []
 for doi in df_openalex['doi_article']:
     try:
         #send GET request
-        response = requests.get(doi)
+        response = http_get(doi)
         response.raise_for_status()
         print(f'Retrieving information for {doi}')
         
@@ -0,0 +1,82 @@
+import gzip
+import json
+import os
+import requests
+import sys
+import time
+
+#call functions from parent utils.py file
+utils_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, utils_dir)
+from utils import CREDENTIALS, configure_cache, configure_session, http_get, http_settings_from_env, load_dead_letters, redact_secrets, save_dead_letters, ROOT_DIR
+
+#read in env file
+parent = os.path.abspath(os.path.join(os.getcwd(), '..'))
+with open(f'{parent}/env.json', 'r') as file:
+    env = json.load(file)
+
+#shared connection-pooled HTTP session for all API calls
+configure_session(http_settings_from_env(env))
+
+#same directories as dataset-records-retrieval.py
+test = env['TOGGLES']['test']
+OUTPUT_DIR = ROOT_DIR / "test" / "outputs" if test else ROOT_DIR / "outputs"
+CHECKPOINT_DIR = OUTPUT_DIR / "checkpoints"
+dead_letter_path = OUTPUT_DIR / "state" / "dead-letters.jsonl"
+##recovered responses are also stored in the response cache (if enabled), so a rerun picks them up even without checkpoints
+configure_cache(OUTPUT_DIR / "cache", env.get('HTTP', {}).get('cache', {}))
+
+#credentials are not stored in the queue; each entry names the one it needs (see CREDENTIALS in utils.py), which is added back from env.json
+##returns None when the credential is not configured, so the request is skipped rather than replayed without it
+def add_credentials(entry):
+    params = dict(entry['params'])
+    headers = {}
+    if entry.get('auth'):
+        credential = CREDENTIALS.get(entry['auth'])
+        secret = env['KEYS'].get(credential['key']) if credential else None
+        if not secret:
+            return None
+        if 'param' in credential:
+            params[credential['param']] = secret
+        else:
+            headers[credential['header']] = secret
+    return params, headers
+
+dead_letters = load_dead_letters(dead_letter_path)
+if not dead_letters:
+    print('No failed requests in the dead-letter queue.\n')
+    sys.exit()
+
+print(f'Re-driving {len(dead_letters)} failed requests\n')
+recovered = 0
+unmerged = 0
+for key, entry in list(dead_letters.items()):
+    credentials = add_credentials(entry)
+    if credentials is None:
+        print(f'Skipping {entry["url"]}: credential "{entry["auth"]}" is not set in env.json\n')
+        continue
+    params, headers = credentials
+    try:
+        response = http_get(entry['url'], params=params, headers=headers or None)
+        response.raise_for_status()
+        data = response.json()
+    except (requests.RequestException, ValueError) as e:
+        print(f'Still failing after {entry["attempts"] + 1} attempts: {entry["url"]} ({redact_secrets(e)})\n')
+        entry.update({'error': redact_secrets(e), 'attempts': entry['attempts'] + 1, 'last_failed': time.strftime('%Y-%m-%dT%H:%M:%S')})
+        continue
+    #appends response to the checkpoint of the run that failed, where the rerun replays it with the pages already received
+    if entry['checkpoint']:
+        with gzip.open(CHECKPOINT_DIR / entry['checkpoint'], 'at', encoding='utf-8') as f:
+            f.write(json.dumps({'key': entry['checkpoint_key'], 'data': data}) + '\n')
+    else:
+        unmerged += 1
+    del dead_letters[key]
+    recovered += 1
+
+save_dead_letters(dead_letters, dead_letter_path)
+
+print(f'{recovered} requests recovered, {len(dead_letters)} still failing.\n')
+if unmerged:
+    print(f'{unmerged} recovered requests came from a run without checkpoints; they are only reused by a rerun if the HTTP cache is enabled.\n')
+if recovered:
+    print('Rerun dataset-records-retrieval.py to merge the recovered responses into the outputs (completed pages are replayed from the checkpoints).\n')
@@ -2,18 +2,19 @@ from datetime import datetime
 from pprint import pformat
 from rapidfuzz import process, fuzz
 from urllib.parse import quote
-from utils import adjust_descriptive_count, check_link, count_words, determine_affiliation, retrieve_all_journals, retrieve_crossref, retrieve_datacite, retrieve_dataverse, retrieve_dryad, retrieve_openalex, retrieve_zenodo, ROOT_DIR #custom functions file
+from utils import AffiliationMatcher, RepositoryClassifier, clear_checkpoints, configure_cache, configure_checkpoints, configure_dead_letters, configure_decoding, configure_session, detect_affiliations, determine_affiliation, extract_datacite_records, get_cache_stats, get_coalesce_stats, get_dead_letter_stats, get_transfer_stats, http_settings_from_env, iter_datacite, iter_datacite_partitioned, iter_dataverse, iter_dryad, iter_records, iter_zenodo, join_harvests, lean_datacite_params, map_unique, probe_dois, retrieve_all_journals, retrieve_crossref, retrieve_datacite_partitioned, retrieve_dois_batched, retrieve_dryad, retrieve_incremental, retrieve_openalex, retrieve_zenodo, score_titles, select_dataverse_record, select_dryad_record, select_zenodo_record, standardize_rights, start_harvests, ROOT_DIR #custom functions file
 import pandas as pd
 import json
 import numpy as np
 import os
-import re
-import requests
 
 #read in env file
 with open('env.json', 'r') as file:
     env = json.load(file)
 
+#shared connection-pooled HTTP session for all API calls
+configure_session(http_settings_from_env(env))
+
 #operator for quick test runs
 test = env['TOGGLES']['test']
 
@@ -65,6 +66,14 @@ figshare_workflow_2 = env['TOGGLES']['figshare_workflow_2']
 load_previous_data = env['TOGGLES']['load_previous_data']
 #if you have done a previous DataCite retrieval and Figshare workflow 1 and don't want to re-run these
 load_previous_data_plus = env['TOGGLES']['load_previous_data_plus']
+##only request DataCite, Dryad, and Zenodo records changed since the last run and merge them into the saved snapshot (Dataverse is always fully harvested)
+incremental = env['TOGGLES'].get('incremental', False)
+##record pages and lookups as they arrive so an interrupted run resumes where it stopped (cleared after a completed run; checkpoints older than CHECKPOINT_MAX_AGE_DAYS are not replayed)
+checkpoints = env['TOGGLES'].get('checkpoints', True)
+##request only the DataCite attributes used below and skip facet computation (smaller, faster pages)
+lean_retrieval = env['TOGGLES'].get('lean_retrieval', False)
+##decode DataCite, Dryad, Dataverse, and Zenodo pages against schemas of the fields used below (requires the optional msgspec package)
+typed_decoding = env['TOGGLES'].get('typed_decoding', False)
 #toggle for executing NCBI process
 ncbi_workflow = env['TOGGLES']['ncbi_workflow']
 ##loading package in only if running NCBI workflow
@@ -96,6 +105,14 @@ LOG_DIR = OUTPUT_DIR / "logs"
 LOG_DIR.mkdir(parents=True, exist_ok=True)
 DATA_DIR = OUTPUT_DIR / "data"
 DATA_DIR.mkdir(parents=True, exist_ok=True)
+STATE_DIR = OUTPUT_DIR / "state"
+if checkpoints:
+    configure_checkpoints(OUTPUT_DIR / "checkpoints")
+##on-disk cache of API responses (see 'cache' in the HTTP block of env.json; offline mode only serves cached responses)
+configure_cache(OUTPUT_DIR / "cache", env.get('HTTP', {}).get('cache', {}))
+##pages and DOI lookups that fail after retries are queued here for accessory-scripts/redrive-dead-letters.py
+configure_dead_letters(STATE_DIR / "dead-letters.jsonl")
+configure_decoding(typed_decoding)
 
 #setting timestamp to calculate run time
 start_time = datetime.now() 
@@ -111,6 +128,8 @@ email = env['EMAIL']['user_email']
 #create permutation string with OR for API parameters
 ut_variations = env['PERMUTATIONS']
 institution_query = ' OR '.join([f'"{variation}"' for variation in ut_variations])
+##compiled once and shared by every affiliation check below
+affiliation_matcher = AffiliationMatcher(ut_variations)
 ##if you need a smaller set of previously identified permutations for an easier API call
 ut_variations_small = env['PERMUTATIONS_IDENTIFIED']
 institution_query_small = ' OR '.join([f'"{variation}"' for variation in ut_variations_small])
@@ -138,6 +157,8 @@ per_page_datacite = env['VARIABLES']['PAGE_SIZES']['datacite']
 per_page_dryad = env['VARIABLES']['PAGE_SIZES']['dryad']
 per_page_dataverse = env['VARIABLES']['PAGE_SIZES']['dataverse']
 per_page_zenodo = env['VARIABLES']['PAGE_SIZES']['zenodo']
+##number of DOIs packed into one DataCite search when retrieving unmatched deposits
+doi_batch_size = env['VARIABLES']['PAGE_SIZES'].get('datacite_doi_batch', 100)
 
 ##page start
 page_start_dryad = env['VARIABLES']['PAGE_STARTS']['dryad']
@@ -150,6 +171,17 @@ page_limit_datacite = env['VARIABLES']['PAGE_LIMITS']['datacite_test'] if test e
 page_limit_zenodo = env['VARIABLES']['PAGE_LIMITS']['zenodo_test'] if test else env['VARIABLES']['PAGE_LIMITS']['zenodo_prod']
 page_limit_openalex = env['VARIABLES']['PAGE_LIMITS']['openalex_test'] if test else env['VARIABLES']['PAGE_LIMITS']['openalex_prod']
 
+#number of requests kept in flight for concurrent retrieval steps (1 = one at a time)
+concurrency = env['VARIABLES'].get('CONCURRENCY', {})
+max_concurrency_doi_lookups = concurrency.get('doi_lookups', 1)
+max_concurrency_doi_probes = concurrency.get('doi_probes', 1)
+##parallel page fan-out for offset-paginated APIs
+max_concurrency_dryad = concurrency.get('dryad', 1)
+max_concurrency_dataverse = concurrency.get('dataverse', 1)
+max_concurrency_zenodo = concurrency.get('zenodo', 1)
+##number of parallel publicationYear partitions for the main DataCite query (not partitioned in test mode, so the test sample stays the first pages of the query)
+datacite_partitions = 1 if test else concurrency.get('datacite_partitions', 1)
+
 params_dryad= {
     'per_page': per_page_dryad,
 }
@@ -169,6 +201,9 @@ else:
         'page[cursor]': 1,
     }
 
+if lean_retrieval:
+    params_datacite = lean_datacite_params(params_datacite)
+
 headers_dataverse = {
     'X-Dataverse-key': env['KEYS']['dataverse_token']
 }
@@ -191,9 +226,7 @@ params_zenodo = {
 #defining some metadata assessment objects
 ##assess 'descriptiveness of dataset title'
 words = env['WORDS']
-###add integers
-numbers = list(map(str, range(1, 1000000)))
-###combine all into a single set
+###combine all into a single set (whole numbers are recognized by pattern in score_titles)
 nondescriptive_words = set(
     words['articles'] +
     words['conjunctions'] +
@@ -202,8 +235,7 @@ nondescriptive_words = set(
     words['possessives'] +
     words['descriptors'] +
     words['order'] +
-    words['version'] +
-    numbers
+    words['version']
 )
 ##software formats
 software_formats = set(env['SOFTWARE_FORMATS'].values())
@@ -212,155 +244,51 @@ format_map = env['FORMAT_MAP']
 
 # Running script
 if not load_previous_data and not load_previous_data_plus and not load_previous_data_plus_ncbi:
-    print('Starting DataCite retrieval based on affiliation.\n')
-    data_datacite = retrieve_datacite(url_datacite, params_datacite, page_start_datacite, page_limit_datacite, per_page_datacite)
-    print(f'Number of datasets found by DataCite API: {len(data_datacite)}\n')
-
     if cross_validate:
-        print('Starting Dryad retrieval.\n')
-        data_dryad = retrieve_dryad(url_dryad, params_dryad, page_start_dryad, per_page_dryad)
-        print(f'Number of Dryad datasets found by Dryad API: {len(data_dryad)}\n')
+        ##the repository APIs do not depend on each other or on DataCite, so they are harvested in the background while DataCite is retrieved and processed below (joined before the cross-validation merges)
+        ##each harvest selects the fields needed for cross-validation from every page while the next pages are being retrieved (raw records are not kept)
+        print('Starting Dryad, Dataverse, and Zenodo retrieval in the background.\n' if dataverse else 'Starting Dryad and Zenodo retrieval in the background.\n')
+        harvests = {}
+        if incremental:
+            harvests['Dryad'] = lambda: [select_dryad_record(item) for item in retrieve_incremental(STATE_DIR, 'dryad', url_dryad, params_dryad, lambda params: retrieve_dryad(url_dryad, params, page_start_dryad, per_page_dryad, max_concurrency_dryad))]
+        else:
+            harvests['Dryad'] = lambda: [select_dryad_record(item) for item in iter_records(iter_dryad(url_dryad, params_dryad, page_start_dryad, per_page_dryad, max_concurrency_dryad))]
         if dataverse:
-            print('Starting Dataverse retrieval.\n')
-            data_dataverse = retrieve_dataverse(url_dataverse, params_dataverse, headers_dataverse, page_start_dataverse, per_page_dataverse)
-            print(f'Number of Dataverse datasets found by Dataverse API: {len(data_dataverse)}\n')
-        print('Starting Zenodo retrieval.\n')
-        data_zenodo = retrieve_zenodo(url_zenodo, params_zenodo, page_start_zenodo, page_limit_zenodo, per_page_zenodo)
-        print(f'Number of Zenodo datasets found by Zenodo API: {len(data_zenodo)}\n')
+            harvests['Dataverse'] = lambda: [select_dataverse_record(item) for item in iter_records(iter_dataverse(url_dataverse, params_dataverse, headers_dataverse, page_start_dataverse, per_page_dataverse, max_concurrency_dataverse))]
+        if incremental:
+            harvests['Zenodo'] = lambda: [select_zenodo_record(item) for item in retrieve_incremental(STATE_DIR, 'zenodo', url_zenodo, params_zenodo, lambda params: retrieve_zenodo(url_zenodo, params, page_start_zenodo, page_limit_zenodo, per_page_zenodo, max_concurrency_zenodo))]
+        else:
+            harvests['Zenodo'] = lambda: [select_zenodo_record(item) for item in iter_records(iter_zenodo(url_zenodo, params_zenodo, page_start_zenodo, page_limit_zenodo, per_page_zenodo, max_concurrency_zenodo))]
+        harvest_futures = start_harvests(harvests)
 
-    print('Beginning dataframe generation.\n')
+    print('Starting DataCite retrieval based on affiliation.\n')
+    if incremental:
+        data_datacite = retrieve_incremental(STATE_DIR, 'datacite', url_datacite, params_datacite, lambda params: retrieve_datacite_partitioned(url_datacite, params, page_start_datacite, page_limit_datacite, per_page_datacite, datacite_partitions))
+    else:
+        ##streamed: records are retrieved page by page while the dataframe is generated below, so raw pages are released once processed
+        data_datacite = iter_records(iter_datacite_partitioned(url_datacite, params_datacite, page_start_datacite, page_limit_datacite, per_page_datacite, datacite_partitions))
 
-    data_select_datacite = [] 
-    for item in data_datacite:
-        attributes = item.get('attributes', {})
-        doi = attributes.get('doi', None)
-        state = attributes.get('state', None)
-        publisher = attributes.get('publisher', '')
-        registered = attributes.get('registered', '')
-        if registered:
-            publisher_year = datetime.fromisoformat(registered.rstrip('Z')).year
-            publisher_date = datetime.fromisoformat(registered.rstrip('Z')).date()
-        else:
-            publisher_year = None
-            publisher_date = None
-        title = attributes.get('titles', [{}])[0].get('title', '')
-        creators = attributes.get('creators', [{}])
-        creators_names = [creator.get('name', '') for creator in creators]
-        creators_formatted = []
-        for creator in creators:
-            name = creator.get('name', '').strip()
-            affiliations = creator.get('affiliation', [])
-            updated_affiliations = []
-            for affil in affiliations:
-                affil_name = affil.get('name', '') if isinstance(affil, dict) else affil
-                if 'Austin' in affil_name:
-                    affil_name = 'University of Texas at Austin'
-                updated_affiliations.append(affil_name)
-            affil_str = ', '.join(updated_affiliations) if updated_affiliations else 'No affiliation listed'
-            creators_formatted.append(f'{name} ({affil_str})')
-        first_creator = creators[0].get('name', None) if creators else None
-        last_creator = creators[-1].get('name', None) if creators else None
-        creators_affiliations = [
-            aff.get('name', '')
-            for creator in creators
-            for aff in (creator.get('affiliation') if isinstance(creator.get('affiliation'), list) else [])
-            if isinstance(aff, dict)
-        ]
-        first_affiliation = creators_affiliations[0] if creators_affiliations else None
-        last_affiliation = creators_affiliations[-1] if creators_affiliations else None
-        contributors = attributes.get('contributors', [{}])
-        contributors_names = [contributor.get('name', '') for contributor in contributors]
-        contributors_affiliations = [
-            aff.get('name', '')
-            for contributor in contributors
-            for aff in (contributor.get('affiliation') if isinstance(contributor.get('affiliation'), list) else [])
-            if isinstance(aff, dict)
-        ]
-        contributors_formatted = []
-        for contributor in contributors:
-            name = contributor.get('name', '').strip()
-            affiliations = contributor.get('affiliation', [])
-            updated_affiliations = []
-            for affil in affiliations:
-                affil_name = affil.get('name', '') if isinstance(affil, dict) else affil
-                if 'Austin' in affil_name:
-                    affil_name = 'University of Texas at Austin'
-                updated_affiliations.append(affil_name)
-            affil_str = ', '.join(updated_affiliations) if updated_affiliations else 'No affiliation listed'
-            contributors_formatted.append(f'{name} ({affil_str})')
-        container = attributes.get('container', {})
-        container_identifier = container.get('identifier', None)
-        related_identifiers = attributes.get('relatedIdentifiers', [])
-        for identifier in related_identifiers:
-            relation_type = identifier.get('relationType', '')
-            related_identifier = identifier.get('relatedIdentifier', '')
-        types = attributes.get('types', {})
-        resource_type = types.get('resourceTypeGeneral', '')
-        subjects = attributes.get('subjects', [])
-        if subjects:
-            subject_list = [subj.get('subject', '').strip() for subj in subjects if subj.get('subject')]
-            subjects_combined = '; '.join(subject_list) if subject_list else 'No keywords provided'
-        else:
-            subjects_combined = 'No keywords provided'
-        sizes = attributes.get('sizes', [])
-        cleaned_sizes = [int(re.sub(r'\D', '', size)) for size in sizes if re.sub(r'\D', '', size).isdigit()]
-        total_size = sum(cleaned_sizes) if cleaned_sizes else 'No file size information'   
-        formats_list = attributes.get('formats', [])
-        formats = set(formats_list) if formats_list else 'No file information' 
-        file_count = len(formats_list) if formats_list else 'No file information'   
-        rights_list = attributes.get('rightsList', [])
-        rights = [right['rights'] for right in rights_list if 'rights' in right] or ['Rights unspecified']
-        rights_code = [right['rightsIdentifier'] for right in rights_list if 'rightsIdentifier' in right] or ['Unknown']
-        views = attributes.get('viewCount', 0)
-        downloads = attributes.get('downloadCount', 0)
-        citations = attributes.get('citationCount', 0)
-        data_select_datacite.append({
-            'doi': doi,
-            'state': state,
-            'publisher': publisher,
-            'publisher_original': publisher,
-            'publication_year': publisher_year,
-            'publication_date': publisher_date,
-            'title': title,
-            'first_author': first_creator,
-            'last_author': last_creator,
-            'first_affiliation': first_affiliation,
-            'last_affiliation': last_affiliation,
-            'creators_names': creators_names,
-            'creators_affiliations': creators_affiliations,
-            'creators_formatted': creators_formatted,
-            'contributors_names': contributors_names,
-            'contributors_affiliations': contributors_affiliations,
-            'contributors_formatted': contributors_formatted,
-            'relation_type': relation_type,
-            'related_identifier': related_identifier,
-            'container_identifier': container_identifier,
-            'type': resource_type,
-            'subjects': subjects_combined,
-            'deposit_size': total_size,
-            'formats': formats,
-            'file_count': file_count,
-            'rights': rights,
-            'rights_code': rights_code,
-            'views': views,
-            'downloads': downloads,
-            'citations': citations,
-            'source': 'DataCite'
-        })
+    print('Beginning dataframe generation.\n')
 
-    df_datacite_initial = pd.json_normalize(data_select_datacite)
+    df_datacite_initial = extract_datacite_records(data_datacite)
+    print(f'Number of datasets found by DataCite API: {len(df_datacite_initial)}\n')
     df_datacite_initial.to_csv(f'{DATA_DIR}/{today}_{resource_filename}_datacite-initial-output.csv', index=False, encoding='utf-8-sig')
 
     if cross_validate:
         #first processing DataCite outputs
         #split out DataCite results for repos to be cross-validated against
         ##coercing all DOIs with 'zenodo' to have publisher of 'Zenodo'
-        df_datacite_initial.loc[df_datacite_initial['doi'].str.contains('zenodo', case=False, na=False), 'publisher'] = 'Zenodo'
-        ##using str.contains to account for any potential name inconsistency for one repository
-        df_datacite_dryad = df_datacite_initial[df_datacite_initial['publisher'].str.contains('Dryad')]
-        df_datacite_dataverse = df_datacite_initial[df_datacite_initial['publisher'].str.contains('Texas Data Repository')]
-        df_datacite_zenodo = df_datacite_initial[df_datacite_initial['publisher'].str.contains('Zenodo')]
-        df_remainder = df_datacite_initial[df_datacite_initial['publisher'].str.contains('Dryad|Texas Data Repository|Zenodo') == False]
+        ##matching on the name to account for any potential name inconsistency for one repository
+        cross_validation_classifier = RepositoryClassifier(
+            renames=[{'pattern': 'zenodo', 'replacement': 'Zenodo', 'case': False, 'column': 'doi'}],
+            categories={'cross_validation': {'rules': [{'pattern': repository, 'case': True, 'label': repository} for repository in ['Dryad', 'Texas Data Repository', 'Zenodo']]}}
+        )
+        cross_validation_groups = cross_validation_classifier.classify(df_datacite_initial)
+        df_datacite_initial['publisher'] = cross_validation_groups['publisher']
+        df_datacite_dryad = df_datacite_initial[cross_validation_groups['cross_validation'] == 'Dryad']
+        df_datacite_dataverse = df_datacite_initial[cross_validation_groups['cross_validation'] == 'Texas Data Repository']
+        df_datacite_zenodo = df_datacite_initial[cross_validation_groups['cross_validation'] == 'Zenodo']
+        df_remainder = df_datacite_initial[cross_validation_groups['cross_validation'].isnull()]
 
         print(f'Number of Dryad datasets found by DataCite API: {len(df_datacite_dryad)}\n')
         print(f'Number of Dataverse datasets found by DataCite API: {len(df_datacite_dataverse)}\n')
@@ -402,36 +330,18 @@ if not load_previous_data and not load_previous_data_plus and not load_previous_
         df_dataverse_undetected = pd.DataFrame()
         df_zenodo_undetected = pd.DataFrame()
 
+        #waiting for the background harvests to finish
+        harvested = join_harvests(harvest_futures)
+        data_select_dryad = harvested['Dryad']
+        print(f'Number of Dryad datasets found by Dryad API: {len(data_select_dryad)}\n')
+        if dataverse:
+            data_select_dataverse = harvested['Dataverse']
+            print(f'Number of Dataverse datasets found by Dataverse API: {len(data_select_dataverse)}\n')
+        data_select_zenodo = harvested['Zenodo']
+        print(f'Number of Zenodo datasets found by Zenodo API: {len(data_select_zenodo)}\n')
+
         print('Dryad step\n')
-        if data_dryad:
-            data_select_dryad = [] 
-            for item in data_dryad:
-                links = item.get('_links', {})
-                doi_dr = item.get('identifier', None)
-                pubDate_dr = item.get('publicationDate', '')
-                title_dr=item.get('title', [{}])
-                authors_dr = item.get('authors', [{}])
-                first_author_first = authors_dr[0].get('firstName', None)
-                first_author_last = authors_dr[0].get('lastName', None)
-                last_author_first = authors_dr[-1].get('firstName', None)
-                last_author_last = authors_dr[-1].get('lastName', None)
-                first_affiliation_dr = authors_dr[0].get('affiliation', None)
-                last_affiliation_dr = authors_dr[-1].get('affiliation', None)
-                related_works_list_dr = [rel.get('identifier', None) for rel in item.get('relatedWorks', [{}])]
-                related_works_list_dr = related_works_list_dr if related_works_list_dr else None
-                author_last_order_dr = authors_dr[-1].get('order', None)
-                data_select_dryad.append({
-                    'doi': doi_dr,
-                    'publication_date': pubDate_dr,
-                    'title': title_dr,
-                    'first_author_first': first_author_first,
-                    'last_author_first': last_author_first,
-                    'first_author_last': first_author_last,
-                    'last_author_last': last_author_last,
-                    'first_affiliation': first_affiliation_dr,
-                    'last_affiliation': last_affiliation_dr,
-                    'related_works': related_works_list_dr
-                })
+        if data_select_dryad:
             df_dryad = pd.json_normalize(data_select_dryad)
             df_dryad.to_csv(f'{DATA_DIR}/{today}_Dryad-API-output.csv', index=False, encoding='utf-8-sig')
             #formatting author names to be consistent with others
@@ -468,36 +378,8 @@ if not load_previous_data and not load_previous_data_plus and not load_previous_
             df_datacite_dryad_joint_unmatched.to_csv(f'{DATA_DIR}/{today}_Dryad-into-DataCite_joint-unmatched-dataframe.csv', index=False, encoding='utf-8-sig')
 
         if dataverse:
-            if data_dataverse:
+            if data_select_dataverse:
                 print('Dataverse step\n')
-                data_select_dataverse = [] 
-                for item in data_dataverse:
-                    globalID = item.get('global_id', '')
-                    versionState = item.get('versionState', None)
-                    pubDate_dataverse = item.get('published_at', '')
-                    title_dataverse = item.get('name', None)
-                    authors_dataverse = item.get('authors', [{}])
-                    contacts_dataverse = item.get('contacts', [{}])
-                    first_contact_dataverse = contacts_dataverse[0].get('name', None)
-                    first_affiliation_contact = contacts_dataverse[0].get('affiliation', None)
-                    last_contact_dataverse = contacts_dataverse[-1].get('name', None)
-                    last_affiliation_contact = contacts_dataverse[-1].get('affiliation', None)
-                    type = item.get('type', None)
-                    dataverse = item.get('name_of_dataverse', None)
-                    data_select_dataverse.append({
-                        'doi': globalID,
-                        'status': versionState,
-                        'publication_date': pubDate_dataverse,
-                        'title': title_dataverse,
-                        'authors': authors_dataverse,
-                        'contacts': contacts_dataverse,
-                        'first_contact': first_contact_dataverse,
-                        'first_contact_affiliation': first_affiliation_contact,
-                        'last_contact': last_contact_dataverse,
-                        'last_contact_affiliation': last_affiliation_contact,
-                        'type': type,
-                        'dataverse': dataverse
-                    })
                 df_dataverse = pd.json_normalize(data_select_dataverse)
                 df_dataverse.to_csv(f'{DATA_DIR}/{today}_TDR-API-output.csv', index=False, encoding='utf-8-sig')
 
@@ -505,10 +387,9 @@ if not load_previous_data and not load_previous_data_plus and not load_previous_
                 df_dataverse_pub = df_dataverse[df_dataverse['status'].str.contains('RELEASED') == True]
                 df_dataverse_pub['doi'] = df_dataverse_pub['doi'].str.lower()
                 #looking for institutional name in any of four fields
-                pattern = '|'.join([f'({perm})' for perm in ut_variations])
                 df_dataverse_pub['authors'] = df_dataverse_pub['authors'].apply(lambda x: str(x))
                 df_dataverse_pub['contacts'] = df_dataverse_pub['contacts'].apply(lambda x: str(x))
-                df_dataverse_pub_filtered = df_dataverse_pub[df_dataverse_pub['authors'].str.contains(pattern, case=False, na=False) | df_dataverse_pub['contacts'].str.contains(pattern, case=False, na=False)]
+                df_dataverse_pub_filtered = df_dataverse_pub[df_dataverse_pub['authors'].map(affiliation_matcher.contains) | df_dataverse_pub['contacts'].map(affiliation_matcher.contains)]
                 print(f'Number of published Dataverse datasets found by Dataverse API: {len(df_dataverse_pub)}\n')
                 df_dataverse_pub_filtered['publication_year'] = pd.to_datetime(df_dataverse_pub_filtered['publication_date'], format='ISO8601').dt.year
                 df_dataverse_pruned = df_dataverse_pub_filtered[['doi', 'publication_year', 'title', 'first_contact', 'first_contact_affiliation', 'last_contact', 'last_contact_affiliation']]
@@ -537,37 +418,7 @@ if not load_previous_data and not load_previous_data_plus and not load_previous_
                 df_datacite_dataverse_joint_unmatched.to_csv(f'{DATA_DIR}/{today}_Dataverse-into-DataCite_joint-unmatched-dataframe.csv', index=False, encoding='utf-8-sig')
 
         print('Zenodo step\n')
-        if data_zenodo:
-            data_select_zenodo = [] 
-            for item in data_zenodo:
-                metadata = item.get('metadata', {})
-                doi = item.get('doi', None)
-                parentDOI = item.get('conceptdoi', None)
-                conceptID = item.get('conceptrecid', None)
-                pubDate_zen = metadata.get('publication_date', '')
-                title_zen = metadata.get('title', '')
-                description_zen = metadata.get('description', None)
-                creators_zen = metadata.get('creators', [{}])
-                first_creator_zen = creators_zen[0].get('name', None)
-                last_creator_zen = creators_zen[-1].get('name', None)
-                first_affiliation_zen = creators_zen[0].get('affiliation', None)
-                last_affiliation_zen = creators_zen[-1].get('affiliation', None)
-                related_works_list_zen = [name.get('identifier', None) for name in metadata.get('relatedWorks', [{}])]
-                related_works_list_zen = related_works_list_zen if related_works_list_zen else None
-                related_works_type_list_zen = [name.get('relation', None) for name in metadata.get('relatedWorks', [{}])]
-                related_works_type_list_zen = related_works_type_list_zen if related_works_type_list_zen else None
-                data_select_zenodo.append({
-                    'doi': parentDOI, #want parent to avoid de-duplication issues later
-                    'publication_date': pubDate_zen,
-                    'title': title_zen,
-                    'description': description_zen,
-                    'first_author': first_creator_zen,
-                    'last_author': last_creator_zen,
-                    'first_affiliation': first_affiliation_zen,
-                    'last_affiliation': last_affiliation_zen,
-                    'related_works': related_works_list_zen,
-                    'related_works_type': related_works_type_list_zen
-                })
+        if data_select_zenodo:
             df_data_zenodo = pd.json_normalize(data_select_zenodo)
             df_data_zenodo.to_csv(f'{DATA_DIR}/{today}_Zenodo-API-output.csv', index=False, encoding='utf-8-sig')
             #removing non-Zenodo deposits indexed by Zenodo (mostly Dryad) from Zenodo output
@@ -625,181 +476,27 @@ if not load_previous_data and not load_previous_data_plus and not load_previous_
             print('No repository DataFrames available to concatenate.\n')
 
         print('Retrieving additional DataCite metadata for unmatched deposits\n')
-        results = []
         if test:
             datacite_new = datacite_new.head(10)
-        for doi in datacite_new['doi']:
-            try:
-                response = requests.get(f'{url_datacite}/{doi}')
-                if response.status_code == 200:
-                    print(f'Retrieving {doi}\n')
-                    results.append(response.json())
-                else:
-                    print(f'Error retrieving {doi}: {response.status_code}, {response.text}')
-            except requests.exceptions.RequestException as e:
-                print(f'Timeout error on DOI {doi}: {e}')
-
-        data_datacite_new = {
-            'datasets': results
-        }
+        results = retrieve_dois_batched(url_datacite, datacite_new['doi'], doi_batch_size, max_concurrency_doi_lookups)
 
-        data_select_datacite_new = []
-        datasets = data_datacite_new.get('datasets', []) 
-        for item in datasets:
-            data = item.get('data', {})
-            attributes = item.get('attributes', {})
-            doi = attributes.get('doi', None)
-            state = attributes.get('state', None)
-            publisher = attributes.get('publisher', '')
-            registered = attributes.get('registered', '')
-            if registered:
-                publisher_year = datetime.fromisoformat(registered.rstrip('Z')).year
-                publisher_date = datetime.fromisoformat(registered.rstrip('Z')).date()
-            else:
-                publisher_year = None
-                publisher_date = None
-            title = attributes.get('titles', [{}])[0].get('title', '')
-            creators = attributes.get('creators', [{}])
-            creators_names = [creator.get('name', '') for creator in creators]
-            contributors_affiliations = [
-                '; '.join(aff.get('name', '') for aff in creator.get('affiliation', []))
-                for creator in creators
-            ]
-            creators_formatted = []
-            for creator in creators:
-                name = creator.get('name', '').strip()
-                affiliations = creator.get('affiliation', [])
-                updated_affiliations = []
-                for affil in affiliations:
-                    affil_name = affil.get('name', '') if isinstance(affil, dict) else affil
-                    if 'Austin' in affil_name:
-                        affil_name = 'University of Texas at Austin'
-                    updated_affiliations.append(affil_name)
-                affil_str = ', '.join(updated_affiliations) if updated_affiliations else 'No affiliation listed'
-                creators_formatted.append(f'{name} ({affil_str})')
-            first_creator = creators[0].get('name', None) if creators else None
-            last_creator = creators[-1].get('name', None) if creators else None
-            creators_affiliations = [
-                aff.get('name', '')
-                for creator in creators
-                for aff in (creator.get('affiliation') if isinstance(creator.get('affiliation'), list) else [])
-                if isinstance(aff, dict)
-            ]
-            first_affiliation = contributors_affiliations[0] if contributors_affiliations else None
-            last_affiliation = contributors_affiliations[-1] if contributors_affiliations else None
-            contributors = attributes.get('contributors', [{}])
-            contributors_names = [contributor.get('name', '') for contributor in contributors]
-            contributors_affiliations = [
-                '; '.join(aff.get('name', '') for aff in contributor.get('affiliation', []))
-                for contributor in contributors
-            ]
-            contributors_formatted = []
-            for contributor in contributors:
-                name = contributor.get('name', '').strip()
-                affiliations = contributor.get('affiliation', [])
-                updated_affiliations = []
-                for affil in affiliations:
-                    affil_name = affil.get('name', '') if isinstance(affil, dict) else affil
-                    if 'Austin' in affil_name:
-                        affil_name = 'University of Texas at Austin'
-                    updated_affiliations.append(affil_name)
-                affil_str = ', '.join(updated_affiliations) if updated_affiliations else 'No affiliation listed'
-                contributors_formatted.append(f'{name} ({affil_str})')
-            container = attributes.get('container', {})
-            container_identifier = container.get('identifier', None)
-            related_identifiers = attributes.get('relatedIdentifiers', [])
-            for identifier in related_identifiers:
-                relation_type = identifier.get('relationType', '')
-                related_identifier = identifier.get('relatedIdentifier', '')
-            types = attributes.get('types', {})
-            resource_type = types.get('resourceTypeGeneral', '')
-            subjects = attributes.get('subjects', [])
-            if subjects:
-                subject_list = [subj.get('subject', '').strip() for subj in subjects if subj.get('subject')]
-                subjects_combined = '; '.join(subject_list) if subject_list else 'No keywords provided'
-            else:
-                subjects_combined = 'No keywords provided'
-            sizes = attributes.get('sizes', [])
-            cleaned_sizes = [int(re.sub(r'\D', '', size)) for size in sizes if re.sub(r'\D', '', size).isdigit()]
-            total_size = sum(cleaned_sizes) if cleaned_sizes else 'No file size information'   
-            formats_list = attributes.get('formats', [])
-            formats = set(formats_list) if formats_list else 'No file information' 
-            file_count = len(formats_list) if formats_list else 'No file information'   
-            rights_list = attributes.get('rightsList', [])
-            rights = [right['rights'] for right in rights_list if 'rights' in right] or ['Rights unspecified']
-            rights_code = [right['rightsIdentifier'] for right in rights_list if 'rightsIdentifier' in right] or ['Unknown']
-            views = attributes.get('viewCount', 0)
-            downloads = attributes.get('downloadCount', 0)
-            citations = attributes.get('citationCount', 0)
-            data_select_datacite.append({
-                'doi': doi,
-                'state': state,
-                'publisher': publisher,
-                'publisher_original': publisher,
-                'publication_year': publisher_year,
-                'publication_date': publisher_date,
-                'title': title,
-                'first_author': first_creator,
-                'last_author': last_creator,
-                'first_affiliation': first_affiliation,
-                'last_affiliation': last_affiliation,
-                'creators_names': creators_names,
-                'creators_affiliations': creators_affiliations,
-                'creators_formatted': creators_formatted,
-                'contributors_names': contributors_names,
-                'contributors_affiliations': contributors_affiliations,
-                'contributors_formatted': contributors_formatted,
-                'relation_type': relation_type,
-                'related_identifier': related_identifier,
-                'container_identifier': container_identifier,
-                'type': resource_type,
-                'subjects': subjects_combined,
-                'deposit_size': total_size,
-                'formats': formats,
-                'file_count': file_count,
-                'rights': rights,
-                'rights_code': rights_code,
-                'views': views,
-                'downloads': downloads,
-                'citations': citations,
-                'source': 'repository cross-validation'
-            })
-
-        df_datacite_new = pd.json_normalize(data_select_datacite_new)
+        ##batched lookups return {'data': record} objects
+        df_datacite_new = extract_datacite_records((item['data'] for item in results), 'repository cross-validation')
         df_datacite_new.to_csv(f'{DATA_DIR}/{today}_datacite-additional-cross-validation.csv', index=False, encoding='utf-8-sig')
     if cross_validate:
         df_datacite_all = pd.concat([df_datacite_initial, df_datacite_new], ignore_index=True)
     else:
         df_datacite_all = df_datacite_initial
 
-    #creating column for source of detected affiliation
-    pattern = '|'.join([f'({perm})' for perm in ut_variations])
-    #search for permutations in the 'affiliations' column
-    df_datacite_all['affiliation_source'] = df_datacite_all.apply(
-        lambda row: 'creator.affiliationName' if pd.Series(row['creators_affiliations']).str.contains(pattern, case=False, na=False).any()
-            else ('creator.name' if pd.Series(row['creators_names']).str.contains(pattern, case=False, na=False).any()
-            else ('contributor.affiliationName' if pd.Series(row['contributors_affiliations']).str.contains(pattern, case=False, na=False).any()
-            else ('contributor.name' if pd.Series(row['contributors_names']).str.contains(pattern, case=False, na=False).any() else None))),
-        axis=1)
-    # pull out the identified permutation and put it into a new column
-    df_datacite_all['affiliation_permutation'] = df_datacite_all.apply(
-    lambda row:
-        next(
-            #exact match (case-sensitive)
-            (perm for perm in ut_variations
-             if any(perm == entry for entry in row['creators_affiliations'] + row['creators_names'] + row['contributors_affiliations'] + row['contributors_names'])),
-            #full-phrase match (case-insensitive)
-            next(
-                (perm for perm in ut_variations
-                 if any(
-                     pd.Series(row['creators_affiliations'] + row['creators_names'] + row['contributors_affiliations'] + row['contributors_names'])
-                     .str.contains(fr'\b{re.escape(perm)}\b', case=True, na=False)
-                 )),
-                None
-            )
-        ),
-    axis=1
-    )
+    #creating columns for source of detected affiliation (first field in this order with a permutation) and the identified permutation
+    ##permutation: exact match first, then full-phrase match (both case-sensitive)
+    affiliation_sources = {
+        'creators_affiliations': 'creator.affiliationName',
+        'creators_names': 'creator.name',
+        'contributors_affiliations': 'contributor.affiliationName',
+        'contributors_names': 'contributor.name'
+    }
+    df_datacite_all[['affiliation_source', 'affiliation_permutation']] = detect_affiliations(df_datacite_all, affiliation_matcher, affiliation_sources)
 
     #handling version duplication (Figshare, ICPSR, etc.)
     ##handling duplication of Figshare deposits (parent vs. child with '.v*')
@@ -958,28 +655,11 @@ if not load_previous_data and not load_previous_data_plus and not load_previous_
     df_datacite['only_code'] = df_datacite['file_format'].apply(lambda x: all(part.strip() in software_formats for part in x.split(';')) if isinstance(x, str) else False)
     df_datacite['title_reformatted'] = df_datacite['title'].str.replace('_', ' ') #gets around text linked by underscores counting as 1 word
     df_datacite['title_reformatted'] = df_datacite['title_reformatted'].str.lower()
-    df_datacite[['total_word_count_title', 'descriptive_word_count_title']] = (df_datacite['title_reformatted'].apply(lambda x: pd.Series(count_words(x, nondescriptive_words))))
-    df_datacite['descriptive_word_count_title'] = df_datacite.apply(adjust_descriptive_count, axis=1)
-    df_datacite['nondescriptive_word_count_title'] = df_datacite['total_word_count_title'] - df_datacite['descriptive_word_count_title']
+    df_datacite[['total_word_count_title', 'descriptive_word_count_title', 'nondescriptive_word_count_title']] = score_titles(df_datacite['title_reformatted'], nondescriptive_words)
 
     #standardizing licenses
     df_datacite['rights'] = df_datacite['rights'].apply(lambda x: ' '.join(x) if isinstance(x, list) else x).astype(str).str.strip('[]')
-    df_datacite['rights_standardized'] = 'Rights unclear'  #default value
-    df_datacite.loc[df_datacite['rights'].str.contains('Creative Commons Zero|CC0'), 'rights_standardized'] = 'CC0'
-    df_datacite.loc[df_datacite['rights'].str.contains('Creative Commons Attribution Non Commercial Share Alike'), 'rights_standardized'] = 'CC BY-NC-SA'
-    df_datacite.loc[df_datacite['rights'].str.contains('Creative Commons Attribution Non Commercial'), 'rights_standardized'] = 'CC BY-NC'
-    df_datacite.loc[df_datacite['rights'].str.contains('Creative Commons Attribution 3.0|Creative Commons Attribution 4.0|Creative Commons Attribution-NonCommercial'), 'rights_standardized'] = 'CC BY'
-    df_datacite.loc[df_datacite['rights'].str.contains('GNU General Public License'), 'rights_standardized'] = 'GNU GPL'
-    df_datacite.loc[df_datacite['rights'].str.contains('Apache License'), 'rights_standardized'] = 'Apache'
-    df_datacite.loc[df_datacite['rights'].str.contains('MIT License'), 'rights_standardized'] = 'MIT'
-    df_datacite.loc[df_datacite['rights'].str.contains('BSD'), 'rights_standardized'] = 'BSD'
-    df_datacite.loc[df_datacite['rights'].str.contains('ODC-BY'), 'rights_standardized'] = 'ODC-BY'
-    df_datacite.loc[df_datacite['rights'].str.contains('Open Access'), 'rights_standardized'] = 'Rights unclear'
-    df_datacite.loc[df_datacite['rights'].str.contains('Closed Access'), 'rights_standardized'] = 'Restricted access'
-    df_datacite.loc[df_datacite['rights'].str.contains('Restricted Access'), 'rights_standardized'] = 'Restricted access'
-    df_datacite.loc[df_datacite['rights'].str.contains('Databrary'), 'rights_standardized'] = 'Custom terms'
-    df_datacite.loc[df_datacite['rights'].str.contains('UCAR'), 'rights_standardized'] = 'Custom terms'
-    df_datacite.loc[df_datacite['rights'] == '', 'rights_standardized'] = 'Rights unclear'
+    df_datacite['rights_standardized'] = standardize_rights(df_datacite['rights']) #see LICENSE_RULES in utils.py
  
     df_datacite.to_csv(f'{DATA_DIR}/{today}_{resource_filename}_datacite-output-for-metadata-assessment.csv', index=False, encoding='utf-8-sig') 
 
@@ -996,39 +676,27 @@ if not load_previous_data and not load_previous_data_plus and not load_previous_
     }
 
     df_datacite_pruned['repository2'] = df_datacite_pruned['publisher'].map(repo_mapping).fillna('Other')
-    df_datacite_pruned['uni_lead'] = df_datacite_pruned.apply(lambda row: determine_affiliation(row, ut_variations), axis=1)
+    df_datacite_pruned['uni_lead'] = map_unique(df_datacite_pruned[['first_author', 'last_author', 'first_affiliation', 'last_affiliation']], lambda row: determine_affiliation(row, affiliation_matcher))
 
     #standardizing repositories with multiple versions of name in dataframe
     ##different institutions may need to add additional repositories; nothing will happen if you don't have any of the ones listed below and don't comment the lines out
     df_datacite_pruned['publisher'] = df_datacite_pruned['publisher'].fillna('None')
-    for repository in repo_map:
-        mask = df_datacite_pruned[repository['column']].str.contains(
-            repository['pattern'], case=repository['case'], na=False
-        )
-        df_datacite_pruned.loc[mask, 'publisher'] = repository['replacement']
+    repository_rules = list(repo_map)
 
     #EDGE CASES, likely unnecessary for other universities, but you will need to find your own edge cases
     ##confusing metadata with UT Austin (but not Dataverse) listed as publisher; have to be manually adjusted over time
     if austin:
-        df_datacite_pruned.loc[(df_datacite_pruned['doi'].str.contains('10.11578/dc')) & (df_datacite_pruned['publisher'].str.contains('University of Texas')), 'publisher'] = 'Department of Energy (DOE) CODE'
-        ##other edge cases
-        df_datacite_pruned.loc[df_datacite_pruned['doi'].str.contains('10.23729/547d8c47-3723-4396-8f84-322c02ccadd0'), 'publisher'] = 'Finnish Fairdata' #labeled publisher as author's name
-
-    #adding categorization
-    ##identifying institutional repositories that are not the Texas Data Repository
-    df_datacite_pruned['non_TDR_IR'] = np.where(df_datacite_pruned['publisher'].str.contains('University|UCLA|UNC|Harvard|Princeton|Johns Hopkins|Caltech|CUHK|Wyoming|Yale|ASU Library|Dataverse|DaRUS', case=True), 'non-TDR institutional', 'not university or TDR')
-    df_datacite_pruned['US_federal'] = np.where(df_datacite_pruned['publisher'].str.contains('NOAA|NIH|NSF|U.S.|DOE|DOD|DOI|National Laboratory|Designsafe|MSD-Live', case=True), 'Federal US repo', 'not federal US repo')
-    df_datacite_pruned['GREI'] = np.where(df_datacite_pruned['publisher'].str.contains('Dryad|figshare|Harvard|Zenodo|Vivli|Mendeley|Open Science Framework', case=False), 'GREI member', 'not GREI member')
-    generalist_keywords = 'Dryad|figshare|Zenodo|Mendeley|Open Science Framework|Science Data Bank'
-    institutional_keywords = 'ASU Library|Boise State|Borealis|Caltech|CUHK|Dataverse|Oregon|Princeton|University|Wyoming|DaRUS|Texas|Institut Laue-Langevin|Jagiellonian|Hopkins|Purdue|Yale|GRO.data|DR-NTU|CUAHSI'
-
-    df_datacite_pruned['scope'] = df_datacite_pruned['publisher'].apply(
-        lambda x: (
-            'Generalist' if pd.notnull(x) and re.search(generalist_keywords, x, re.IGNORECASE)
-            else 'Institutional' if pd.notnull(x) and re.search(institutional_keywords, x, re.IGNORECASE)
-            else 'Specialist'
-        )
-    )
+        repository_rules += [
+            {'pattern': '10.11578/dc', 'replacement': 'Department of Energy (DOE) CODE', 'case': True, 'column': 'doi', 'publisher': 'University of Texas'},
+            ##other edge cases
+            {'pattern': '10.23729/547d8c47-3723-4396-8f84-322c02ccadd0', 'replacement': 'Finnish Fairdata', 'case': True, 'column': 'doi'} #labeled publisher as author's name
+        ]
+
+    #adding categorization (non-TDR institutional, US federal, GREI member, and scope; see REPOSITORY_CATEGORIES in utils.py)
+    ##renames and categories are resolved together, once per distinct publisher
+    repository_classifier = RepositoryClassifier(repository_rules, env.get('REPOSITORY_CATEGORIES'))
+    repository_classes = repository_classifier.classify(df_datacite_pruned)
+    df_datacite_pruned[repository_classes.columns] = repository_classes
     df_datacite_pruned = df_datacite_pruned.rename(columns={'publisher': 'repository'})
 
     #manually reclassifying certain resourceTypes
@@ -1044,14 +712,14 @@ if not load_previous_data and not load_previous_data_plus and not load_previous_
     ##cloning df
     df_datacite_researchers = df_datacite_pruned
     df_datacite_researchers['affiliated_creators'] = df_datacite_researchers['creators_formatted'].apply(
-    lambda creators: [creator for creator in creators if any(perm.lower() in creator.lower() for perm in ut_variations)] if isinstance(creators, list) else [])
+    lambda creators: affiliation_matcher.filter(creators))
     df_datacite_researchers['affiliated_contributors'] = df_datacite_researchers['contributors_formatted'].apply(
-    lambda contributors: [contributor for contributor in contributors if any(perm.lower() in contributor.lower() for perm in ut_variations)] if isinstance(contributors, list)else [])
+    lambda contributors: affiliation_matcher.filter(contributors))
     df_datacite_researchers['affiliated_creators'] = df_datacite_researchers['affiliated_creators'].apply(lambda x: '; '.join(x))
     df_datacite_researchers['affiliated_contributors'] = df_datacite_researchers['affiliated_contributors'].apply(lambda x: '; '.join(x))
 
     df_datacite_researchers['affiliated_combined'] = df_datacite_researchers.apply(
-    lambda row: list({researcher for col in ['creators_formatted', 'contributors_formatted'] if isinstance(row[col], list) for researcher in row[col] if any(perm.lower() in researcher.lower() for perm in ut_variations)}),axis=1)
+    lambda row: list({researcher for col in ['creators_formatted', 'contributors_formatted'] for researcher in affiliation_matcher.filter(row[col])}),axis=1)
     df_datacite_researchers['affiliated_combined'] = df_datacite_researchers['affiliated_combined'].apply(lambda x: '; '.join(x))
     df_datacite_researchers['affiliated_combined'] = df_datacite_researchers['affiliated_combined'].apply(
     lambda x: [i.strip() for i in x.split(';')] if pd.notnull(x) and x != '' else []
@@ -1129,7 +797,9 @@ if figshare_workflow_1:
     #pull in map of publisher names and OpenAlex codes
     publisher_mapping = env['FIGSHARE_PARTNERS']
     #create empty object to store results
-    data_select_datacite = [] 
+    datacite_figshare_frames = []
+    ##columns kept from the DataCite records of each publisher
+    figshare_datacite_columns = ['doi', 'state', 'repository', 'publisher_original', 'publication_year', 'publication_date', 'title', 'creators_names', 'contributors_affiliations', 'creators_formatted', 'relation_type', 'related_identifier', 'related_identifier_type', 'container_identifier', 'type', 'subjects', 'deposit_size', 'formats', 'file_count', 'rights', 'rights_code', 'views', 'downloads', 'citations']
     data_select_openalex = []
 
     for publisher_name, openalex_code in publisher_mapping.items():
@@ -1164,150 +834,16 @@ if figshare_workflow_1:
                 'page[size]': env['VARIABLES']['PAGE_SIZES']['datacite'],
                 'page[cursor]': 1,
                 }
+            if lean_retrieval:
+                params_datacite_figshare = lean_datacite_params(params_datacite_figshare)
 
             print(f'Starting DataCite retrieval for {publisher_name}.\n')
-            data_datacite_figshare = retrieve_datacite(url_datacite, params_datacite_figshare, page_start_datacite, page_limit_datacite, per_page_datacite)
-            print(f'Number of datasets associated with {publisher_name} found by DataCite API: {len(data_datacite_figshare)}\n')
-            
-            for item in data_datacite_figshare:
-                if not isinstance(item, dict):
-                    print(f'ERROR: item is not a dict! Type: {type(item)}, Value: {item}')
-                    continue
-                attributes = item.get('attributes', {})
-                doi_dc = attributes.get('doi', None)
-                state = attributes.get('state', None)
-                publisher_dc = attributes.get('publisher', '')
-                publisher_year_dc = attributes.get('publicationYear', '')
-                registered = attributes.get('registered', '')
-                if registered:
-                    publisher_year_dc = datetime.fromisoformat(registered.rstrip('Z')).year
-                    publisher_date_dc = datetime.fromisoformat(registered.rstrip('Z')).date()
-                else:
-                    publisher_year_dc = None
-                    publisher_date_dc = None
-                title_dc = attributes.get('titles', [{}])[0].get('title', '')
-                creators_dc = attributes.get('creators', [{}])
-                if not isinstance(creators_dc, list):
-                    print(f'ERROR: creators_dc is not a list! Type: {type(creators_dc)}, Value: {creators_dc}')
-                    creators_dc = [{}]
-                creators_names = []
-                contributors_affiliations = []
-                for creator in creators_dc:
-                    if not isinstance(creator, dict):
-                        print(f'ERROR: creator is not a dict! Type: {type(creator)}, Value: {creator}')
-                        continue
-                    creators_names.append(creator.get('name', ''))
-                    affiliations = creator.get('affiliation', [])
-                    aff_names = []
-                    if not isinstance(affiliations, list):
-                        print(f'ERROR: affiliations is not a list! Type: {type(affiliations)}, Value: {affiliations}')
-                        continue
-                    for aff in affiliations:
-                        if isinstance(aff, dict):
-                            aff_names.append(aff.get('name', ''))
-                        elif isinstance(aff, str):
-                            aff_names.append(aff)
-                        else:
-                            print(f'ERROR: affiliation is not dict or str! Type: {type(aff)}, Value: {aff}')
-                    contributors_affiliations.append('; '.join(aff_names) if aff_names else '')
-                creators_formatted = []
-                for creator in creators:
-                    name = creator.get('name', '').strip()
-                    affiliations = creator.get('affiliation', [])
-                    updated_affiliations = []
-                    for affil in affiliations:
-                        affil_name = affil.get('name', '') if isinstance(affil, dict) else affil
-                        if 'Austin' in affil_name:
-                            affil_name = 'University of Texas at Austin'
-                        updated_affiliations.append(affil_name)
-                    affil_str = ', '.join(updated_affiliations) if updated_affiliations else 'No affiliation listed'
-                    creators_formatted.append(f'{name} ({affil_str})')
-                contributors_dc = attributes.get('contributors', [{}])
-                if not isinstance(contributors_dc, list):
-                    print(f'ERROR: contributors_dc is not a list! Type: {type(contributors_dc)}, Value: {contributors_dc}')
-                    contributors_dc = [{}]
-                contributors_names = []
-                contributors_affiliations = []
-                for contributor in contributors_dc:
-                    if not isinstance(contributor, dict):
-                        print(f'ERROR: creator is not a dict! Type: {type(contributor)}, Value: {contributor}')
-                        continue
-                    contributors_names.append(contributor.get('name', ''))
-                    affiliations = contributor.get('affiliation', [])
-                    aff_names = []
-                    if not isinstance(affiliations, list):
-                        print(f'ERROR: affiliations is not a list! Type: {type(affiliations)}, Value: {affiliations}')
-                        continue
-                    for aff in affiliations:
-                        if isinstance(aff, dict):
-                            aff_names.append(aff.get('name', ''))
-                        elif isinstance(aff, str):
-                            aff_names.append(aff)
-                        else:
-                            print(f'ERROR: affiliation is not dict or str! Type: {type(aff)}, Value: {aff}')
-                    contributors_affiliations.append('; '.join(aff_names) if aff_names else '')
-                for contributor in contributors:
-                    name = contributor.get('name', '').strip()
-                    affiliations = contributor.get('affiliation', [])
-                    updated_affiliations = []
-                    for affil in affiliations:
-                        affil_name = affil.get('name', '') if isinstance(affil, dict) else affil
-                        if 'Austin' in affil_name:
-                            affil_name = 'University of Texas at Austin'
-                        updated_affiliations.append(affil_name)
-                    affil_str = ', '.join(updated_affiliations) if updated_affiliations else 'No affiliation listed'
-                    contributors_formatted.append(f'{name} ({affil_str})')
-                related_identifiers = attributes.get('relatedIdentifiers', [])
-                container_dc = attributes.get('container', {})
-                container_identifier_dc = container_dc.get('identifier', None)
-                types = attributes.get('types', {})
-                resource_type = types.get('resourceTypeGeneral', '')
-                subjects = attributes.get('subjects', [])
-                if subjects:
-                    subject_list = [subj.get('subject', '').strip() for subj in subjects if subj.get('subject')]
-                    subjects_combined = '; '.join(subject_list) if subject_list else 'No keywords provided'
-                else:
-                    subjects_combined = 'No keywords provided'
-                sizes = attributes.get('sizes', [])
-                cleaned_sizes = [int(re.sub(r'\D', '', size)) for size in sizes if re.sub(r'\D', '', size).isdigit()]
-                total_size = sum(cleaned_sizes) if cleaned_sizes else 'No file size information'   
-                formats_list = attributes.get('formats', [])
-                formats = set(formats_list) if formats_list else 'No file information' 
-                file_count = len(formats_list) if formats_list else 'No file information'   
-                rights_list = attributes.get('rightsList', [])
-                rights = [right['rights'] for right in rights_list if 'rights' in right] or ['Rights unspecified']
-                rights_code = [right['rightsIdentifier'] for right in rights_list if 'rightsIdentifier' in right] or ['Unknown']
-                views = attributes.get('viewCount', 0)
-                downloads = attributes.get('downloadCount', 0)
-                citations = attributes.get('citationCount', 0)
-
-                for rel in related_identifiers: #'explodes' deposits with multiple relatedIdentifiers
-                    data_select_datacite.append({
-                        'doi': doi_dc,
-                        'state': state,
-                        'repository': publisher_dc,
-                        'publisher_original': publisher_dc,
-                        'publication_year': publisher_year_dc,
-                        'publication_date': publisher_date_dc,
-                        'title': title_dc,
-                        'creators_names': creators_names,
-                        'contributors_affiliations': contributors_affiliations,
-                        'creators_formatted': creators_formatted,
-                        'relation_type': rel.get('relationType'),
-                        'related_identifier': rel.get('relatedIdentifier'),
-                        'related_identifier_type': rel.get('relatedIdentifierType'),
-                        'container_identifier': container_identifier_dc,
-                        'type': resource_type,
-                        'subjects': subjects_combined,
-                        'deposit_size': total_size,
-                        'formats': formats,
-                        'file_count': file_count,
-                        'rights': rights,
-                        'rights_code': rights_code,
-                        'views': views,
-                        'downloads': downloads,
-                        'citations': citations
-                    })
+            ##streamed: records are processed page by page as they arrive
+            data_datacite_figshare = iter_records(iter_datacite(url_datacite, params_datacite_figshare, page_start_datacite, page_limit_datacite, per_page_datacite, 'DataCite (Figshare)'))
+            ##one row per related identifier
+            df_datacite_figshare = extract_datacite_records(data_datacite_figshare, explode_related=True)
+            datacite_figshare_frames.append(df_datacite_figshare.rename(columns={'publisher': 'repository'})[figshare_datacite_columns])
+            print(f'Number of datasets associated with {publisher_name} found by DataCite API: {df_datacite_figshare.attrs["records"]}\n')
             print(f'Starting OpenAlex retrieval for {publisher_name}.\n')
             openalex = retrieve_openalex(url_openalex, params_openalex, page_limit_openalex)
             if openalex:
@@ -1349,7 +885,7 @@ if figshare_workflow_1:
             print(f'An error occurred with the retrieval for {publisher_name}: {e}')
             continue 
 
-    df_datacite_initial = pd.json_normalize(data_select_datacite)
+    df_datacite_initial = pd.concat(datacite_figshare_frames, ignore_index=True) if datacite_figshare_frames else pd.DataFrame(columns=figshare_datacite_columns)
     df_datacite_initial.to_csv(f'{DATA_DIR}/{today}_{figshare_resource_filename}_figshare-discovery-initial.csv', index=False, encoding='utf-8-sig')
 
     if countVersions:
@@ -1393,28 +929,11 @@ if figshare_workflow_1:
 
     new_figshare['title_reformatted'] = new_figshare['title'].str.replace('_', ' ') #gets around text linked by underscores counting as 1 word
     new_figshare['title_reformatted'] = new_figshare['title_reformatted'].str.lower()
-    new_figshare[['total_word_count_title', 'descriptive_word_count_title']] = (new_figshare['title_reformatted'].apply(lambda x: pd.Series(count_words(x, nondescriptive_words))))
-    new_figshare['descriptive_word_count_title'] = new_figshare.apply(adjust_descriptive_count, axis=1)
-    new_figshare['nondescriptive_word_count_title'] = new_figshare['total_word_count_title'] - new_figshare['descriptive_word_count_title']
+    new_figshare[['total_word_count_title', 'descriptive_word_count_title', 'nondescriptive_word_count_title']] = score_titles(new_figshare['title_reformatted'], nondescriptive_words)
 
     #standardizing licenses
     new_figshare['rights'] = new_figshare['rights'].apply(lambda x: ' '.join(x) if isinstance(x, list) else x).astype(str).str.strip('[]')
-    new_figshare['rights_standardized'] = 'Rights unclear'  #default value
-    new_figshare.loc[new_figshare['rights'].str.contains('Creative Commons Zero|CC0'), 'rights_standardized'] = 'CC0'
-    new_figshare.loc[new_figshare['rights'].str.contains('Creative Commons Attribution Non Commercial Share Alike'), 'rights_standardized'] = 'CC BY-NC-SA'
-    new_figshare.loc[new_figshare['rights'].str.contains('Creative Commons Attribution Non Commercial'), 'rights_standardized'] = 'CC BY-NC'
-    new_figshare.loc[new_figshare['rights'].str.contains('Creative Commons Attribution 3.0|Creative Commons Attribution 4.0|Creative Commons Attribution-NonCommercial'), 'rights_standardized'] = 'CC BY'
-    new_figshare.loc[new_figshare['rights'].str.contains('GNU General Public License'), 'rights_standardized'] = 'GNU GPL'
-    new_figshare.loc[new_figshare['rights'].str.contains('Apache License'), 'rights_standardized'] = 'Apache'
-    new_figshare.loc[new_figshare['rights'].str.contains('MIT License'), 'rights_standardized'] = 'MIT'
-    new_figshare.loc[new_figshare['rights'].str.contains('BSD'), 'rights_standardized'] = 'BSD'
-    new_figshare.loc[new_figshare['rights'].str.contains('ODC-BY'), 'rights_standardized'] = 'ODC-BY'
-    new_figshare.loc[new_figshare['rights'].str.contains('Open Access'), 'rights_standardized'] = 'Rights unclear'
-    new_figshare.loc[new_figshare['rights'].str.contains('Closed Access'), 'rights_standardized'] = 'Restricted access'
-    new_figshare.loc[new_figshare['rights'].str.contains('Restricted Access'), 'rights_standardized'] = 'Restricted access'
-    new_figshare.loc[new_figshare['rights'].str.contains('Databrary'), 'rights_standardized'] = 'Custom terms'
-    new_figshare.loc[new_figshare['rights'].str.contains('UCAR'), 'rights_standardized'] = 'Custom terms'
-    new_figshare.loc[new_figshare['rights'] == '', 'rights_standardized'] = 'Rights unclear'
+    new_figshare['rights_standardized'] = standardize_rights(new_figshare['rights']) #see LICENSE_RULES in utils.py
 
     #file formats (not presently returned for mediated deposits)
     new_figshare['file_format'] = new_figshare['formats'].apply(
@@ -1426,7 +945,7 @@ if figshare_workflow_1:
     #adding in columns to reconcatenate with full dataset
     new_figshare['first_affiliation'] = new_figshare['first_affiliation'].apply(lambda x: ' '.join([str(item) for item in x if item is not None]) if isinstance(x, list) else x)
     new_figshare['last_affiliation'] = new_figshare['last_affiliation'].apply(lambda x: ' '.join([str(item) for item in x if item is not None]) if isinstance(x, list) else x)    
-    new_figshare['uni_lead'] = new_figshare.apply(lambda row: determine_affiliation(row, ut_variations), axis=1)
+    new_figshare['uni_lead'] = map_unique(new_figshare[['first_author', 'last_author', 'first_affiliation', 'last_affiliation']], lambda row: determine_affiliation(row, affiliation_matcher))
     new_figshare['repository'] = 'figshare'
     new_figshare['source'] = 'DataCite+' #slight differentiation from records only retrieved from DataCite
     new_figshare['repository2'] = 'Other'
@@ -1485,6 +1004,14 @@ if figshare_workflow_2:
         'mailto': env['EMAIL']['user_email']
     }
 
+    #existence checks of hypothetical DOIs are cached across runs (negative results expire sooner, in case the deposit is registered later)
+    probe_cache = STATE_DIR / 'doi-probes.jsonl'
+    probe_ttl = env['VARIABLES'].get('DOI_PROBE_TTL_DAYS', {})
+    probe_ttl_positive = probe_ttl.get('positive', 90)
+    probe_ttl_negative = probe_ttl.get('negative', 7)
+    ##'resolver' (default) checks each DOI at doi.org; 'registry' asks DataCite and Crossref in batches (Handle API for the rest)
+    doi_checker = env['TOGGLES'].get('figshare_workflow_2_checker', 'resolver')
+
     #JSON dictionary of journals for Crossref API query (PLOS in this example)
     with open('journal-list.json', 'r') as file:
         journal_list = json.load(file)
@@ -1495,7 +1022,7 @@ if figshare_workflow_2:
         df_openalex['hypothetical_dataset'] = df_openalex['doi'] + '.s001'
         
         #Check if each DOI with suffix redirects to a real page and create a new column
-        df_openalex['Valid'] = df_openalex['hypothetical_dataset'].apply(check_link)
+        df_openalex['Valid'] = probe_dois(df_openalex['hypothetical_dataset'], probe_cache, max_concurrency_doi_probes, probe_ttl_positive, probe_ttl_negative, doi_checker, (url_datacite, url_crossref.rstrip('/')), doi_batch_size)
         df_openalex.to_csv(f'{DATA_DIR}/{today}_openalex-articles-with-hypothetical-deposits.csv', index=False, encoding='utf-8-sig')
         print(f'Number of valid datasets: {len(df_openalex)}.')
     else:
@@ -1526,7 +1053,7 @@ if figshare_workflow_2:
         df_crossref['hypothetical_dataset'] = df_crossref['doi_html'] + '.s001'
 
         # Check if each DOI with suffix redirects to a real page and create a new column
-        df_crossref['Valid'] = df_crossref['hypothetical_dataset'].apply(check_link)
+        df_crossref['Valid'] = probe_dois(df_crossref['hypothetical_dataset'], probe_cache, max_concurrency_doi_probes, probe_ttl_positive, probe_ttl_negative, doi_checker, (url_datacite, url_crossref.rstrip('/')), doi_batch_size)
         df_crossref.to_csv(f'{DATA_DIR}/{today}_crossref-articles-with-hypothetical-deposits.csv', index=False, encoding='utf-8-sig')
         print(f'Number of valid datasets: {len(df_crossref)}.')
 
@@ -1571,8 +1098,9 @@ if ncbi_workflow:
         #NCBI requires email to be provided
         Entrez.email = f'{email}'
 
-        #if you get a free API key, increases rate limit from 3/sec to 10/sec
-        #Entrez.api_key = 'YOUR_NCBI_API_KEY'
+        #if you get a free API key, increases rate limit from 3/sec to 10/sec (Biopython throttles itself accordingly)
+        if env['KEYS'].get('ncbi_token'):
+            Entrez.api_key = env['KEYS']['ncbi_token']
 
         search_term = env['INSTITUTION']['name'] #check that this string is the right one in the web interface
         handle = Entrez.esearch(db='bioproject', term=search_term, usehistory='y', retmax=1200) #currently at 955
@@ -1648,7 +1176,7 @@ if ncbi_workflow:
     ncbi = pd.DataFrame(data_list)
     ncbi['publication_year'] = pd.to_datetime(ncbi['publication_date']).dt.year
     ##look for one of the permutation strings listed in env.json
-    ncbi['first_affiliation'] = ncbi.apply(lambda row: next((perm for perm in ut_variations if perm in row['Affiliation']), None), axis=1)
+    ncbi['first_affiliation'] = ncbi['Affiliation'].map(affiliation_matcher.first_permutation)
 
     ##removing hits that have one of the keywords in a different field like the title
     ncbi_df_select = ncbi[ncbi['Affiliation'].str.contains(uni_identifier)]
@@ -1688,9 +1216,7 @@ if ncbi_workflow:
     #select metadata assessment for titles
     ncbi_df_select['title_reformatted'] = ncbi_df_select['title'].str.replace('_', ' ') #gets around text linked by underscores counting as 1 word
     ncbi_df_select['title_reformatted'] = ncbi_df_select['title_reformatted'].str.lower()
-    ncbi_df_select[['total_word_count_title', 'descriptive_word_count_title']] = (ncbi_df_select['title_reformatted'].apply(lambda x: pd.Series(count_words(x, nondescriptive_words))))
-    ncbi_df_select['descriptive_word_count_title'] = ncbi_df_select.apply(adjust_descriptive_count, axis=1)
-    ncbi_df_select['nondescriptive_word_count_title'] = ncbi_df_select['total_word_count_title'] - ncbi_df_select['descriptive_word_count_title']
+    ncbi_df_select[['total_word_count_title', 'descriptive_word_count_title', 'nondescriptive_word_count_title']] = score_titles(ncbi_df_select['title_reformatted'], nondescriptive_words)
     ncbi_df_select['rights_standardized'] = 'Rights unclear'
     ncbi_df_select['repository2'] = 'NCBI'
     ncbi_df_select['uni_lead'] = 'Affiliated (authorship unclear)'    
@@ -1863,6 +1389,23 @@ with open(f'logs/{unique_timestamp}-log.txt', 'w') as resultssummaryfile:
     log_selected_env(env, fields_to_log, resultssummaryfile)
     resultssummaryfile.write('\n')
 
+    #writes HTTP cache usage
+    cache_stats = get_cache_stats()
+    if cache_stats['enabled']:
+        cacheMode = 'offline (cache only)' if cache_stats['offline'] else 'online'
+        resultssummaryfile.write(f'HTTP cache ({cacheMode}): {cache_stats['hits']} hits, {cache_stats['misses']} misses ({cache_stats['stale']} expired), {cache_stats['stores']} responses stored, {cache_stats['evictions']} evicted; {cache_stats['size_mb']} MB on disk.\n')
+
+    #writes duplicate requests answered by an identical in-flight or recent request
+    coalesce_stats = get_coalesce_stats()
+    resultssummaryfile.write(f'GET requests: {coalesce_stats['requests']}, of which {coalesce_stats['suppressed']} duplicates were answered without a new request.\n')
+    #writes data transferred per API host
+    for host, transfer in get_transfer_stats().items():
+        resultssummaryfile.write(f'{host}: {transfer['requests']} requests, {transfer['bytes'] / 1e6:.1f} MB transferred, {transfer['seconds_per_request']} seconds per request.\n')
+
+    #writes failed requests left in the dead-letter queue
+    dead_letter_stats = get_dead_letter_stats()
+    resultssummaryfile.write(f'Failed requests: {dead_letter_stats['recorded']} failures recorded, {dead_letter_stats['resolved']} earlier failures recovered, {dead_letter_stats['queued']} requests in the dead-letter queue.\n')
+
 #writes to master CSV file
 ##ensuring it writes to the same file regardless of env
 script_dir = os.path.dirname(os.path.abspath(__file__))
@@ -1886,7 +1429,11 @@ log_entry = {
     'loadedPrevious': env['TOGGLES']['load_previous_data'],
     'loadedPreviousPlus': env['TOGGLES']['load_previous_data_plus'],
     'loadedPreviousPlusNCBI': env['TOGGLES']['load_previous_data_plus_ncbi'],
-    'loadedCrossref': env['TOGGLES']['load_crossref']
+    'loadedCrossref': env['TOGGLES']['load_crossref'],
+    'incremental': incremental,
+    'cache_hits': cache_stats['hits'],
+    'cache_misses': cache_stats['misses'],
+    'dead_letters': dead_letter_stats['queued']
 }
 
 try:
@@ -1897,6 +1444,14 @@ except FileNotFoundError:
 
 df.to_csv(comp_log_file, index=False)
 
+#run completed, so the next run starts from scratch
+##unless failed requests are still queued: checkpoints are then kept so that, after re-driving the dead letters, a rerun rebuilds the outputs from disk (failures that were resolved during the run do not count)
+queued = get_dead_letter_stats()['queued']
+if queued:
+    print(f'{queued} failed requests queued in {STATE_DIR / "dead-letters.jsonl"}. Checkpoints kept; run accessory-scripts/redrive-dead-letters.py and then rerun this script to merge the recovered responses into the outputs.\n')
+else:
+    clear_checkpoints()
+
 print('Logging completed. Script completed.\n')
 
 print(f'Time to run: {datetime.now() - start_time}')
@@ -1,76 +1,831 @@
+import asyncio
+import gzip
+import hashlib
+import json
 import math
 import os
 import pandas as pd
+import random
+import re
 import requests
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import date
+from email.utils import parsedate_to_datetime
+from functools import partial
+from itertools import islice
 from pathlib import Path
-from urllib.parse import urlparse, parse_qs
+from typing import TypedDict
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from urllib.parse import urlencode, urlparse, urlunparse, parse_qs, parse_qsl
+from urllib3.util import make_headers
+try:
+    import msgspec
+except ImportError:
+    ##optional: only used for typed decoding (see configure_decoding)
+    msgspec = None
 
 # Getting root directory
 ROOT_DIR = Path(__file__).resolve().parent
 
+### HTTP session ###
+
+# Default connection settings (can be overridden with the 'HTTP' block in env.json)
+HTTP_DEFAULTS = {
+    'timeout': 30,
+    'pool_connections': 10,
+    'pool_maxsize': 10,
+    'host_pool_sizes': {},
+    'host_timeouts': {},
+    'max_workers': 16,
+    'rate_limits': {},
+    'max_retries': 5,
+    'backoff_base': 1,
+    'backoff_max': 60,
+    'mailto': '',
+    'recent_responses': 8,
+    'recent_ttl': 60,
+    'prefetch_pages': 2
+}
+#responses worth retrying (throttling and transient server errors)
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+_session = None
+_http_settings = dict(HTTP_DEFAULTS)
+_rate_limiters = {}
+_transfer_stats = {}
+_transfer_lock = threading.Lock()
+_in_flight = {}
+_recent_responses = OrderedDict()
+_coalesce_lock = threading.Lock()
+_coalesce_stats = {'requests': 0, 'suppressed': 0}
+
+# Token bucket limiting one host to a steady request rate (thread-safe; callers reserve a slot and sleep outside the lock)
+class RateLimiter:
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    # Waits until a request may be sent
+    def acquire(self):
+        with self.lock:
+            self._refill()
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
+
+    # Holds back every caller for the given number of seconds (e.g., after a 429)
+    def pause(self, seconds):
+        with self.lock:
+            self._refill()
+            self.tokens = min(self.tokens, 0) - seconds * self.rate
+
+# Builds the shared keep-alive session used for all API calls (one connection pool per host)
+def configure_session(settings=None):
+    global _session, _http_settings
+    _http_settings = {**HTTP_DEFAULTS, **(settings or {})}
+    if _session is not None:
+        _session.close()
+    _rate_limiters.clear()
+    _recent_responses.clear()
+    for host, rate in _http_settings['rate_limits'].items():
+        _rate_limiters[host] = RateLimiter(rate)
+
+    session = requests.Session()
+    #negotiates gzip/deflate (and brotli/zstd if the decoders are installed)
+    session.headers.update(make_headers(keep_alive=True, accept_encoding=True))
+    ##identifies the caller for 'polite' pools (Crossref, OpenAlex)
+    if _http_settings['mailto']:
+        session.headers['User-Agent'] = f"research-data-discovery (mailto:{_http_settings['mailto']})"
+    default_adapter = HTTPAdapter(pool_connections=_http_settings['pool_connections'], pool_maxsize=_http_settings['pool_maxsize'])
+    session.mount('https://', default_adapter)
+    session.mount('http://', default_adapter)
+    ##larger pools for hosts that receive many (or concurrent) requests
+    for host, pool_size in _http_settings['host_pool_sizes'].items():
+        session.mount(f'https://{host}', HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+
+    _session = session
+    return _session
+# Collects HTTP settings from env.json (HTTP block, email for polite pools, NCBI rate depending on API key)
+def http_settings_from_env(env):
+    settings = dict(env.get('HTTP', {}))
+    settings['mailto'] = env.get('EMAIL', {}).get('user_email', '')
+    ##NCBI E-utilities allow 10 requests/second with an API key and 3/second without
+    rate_limits = dict(settings.get('rate_limits', {}))
+    rate_limits['eutils.ncbi.nlm.nih.gov'] = 10 if env.get('KEYS', {}).get('ncbi_token') else 3
+    settings['rate_limits'] = rate_limits
+    return settings
+# Returns the shared session, creating it with default settings if needed
+def get_session():
+    if _session is None:
+        configure_session()
+    return _session
+# Resolves default timeout for a URL (per-host override or global default)
+def get_timeout(url):
+    host = urlparse(url).netloc
+    return _http_settings['host_timeouts'].get(host, _http_settings['timeout'])
+# Reads Retry-After header (seconds or HTTP date) in seconds, if present
+def get_retry_after(response):
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+# Exponential backoff with full jitter
+def get_backoff(attempt):
+    return random.uniform(0, min(_http_settings['backoff_max'], _http_settings['backoff_base'] * 2 ** attempt))
+# Sends request through the shared session, throttled per host and retried on throttling/transient errors
+def http_request(method, url, params=None, headers=None, timeout=None, **kwargs):
+    session = get_session()
+    host = urlparse(url).netloc
+    limiter = _rate_limiters.get(host)
+    max_retries = _http_settings['max_retries']
+    for attempt in range(max_retries + 1):
+        if limiter:
+            limiter.acquire()
+        try:
+            response = session.request(method, url, params=params, headers=headers, timeout=timeout or get_timeout(url), **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if attempt == max_retries:
+                raise
+            delay = get_backoff(attempt)
+            print(f'{type(e).__name__} from {host}, retrying in {delay:.1f} seconds (attempt {attempt + 1} of {max_retries})')
+        else:
+            ##server-announced quota exhausted: hold back all callers for this host until it resets
+            if limiter and response.headers.get('X-RateLimit-Remaining') == '0' and response.headers.get('X-RateLimit-Reset', '').isdigit():
+                limiter.pause(max(0, int(response.headers['X-RateLimit-Reset']) - time.time()))
+            record_transfer(host, response, kwargs.get('stream', False))
+            if response.status_code not in RETRY_STATUSES or attempt == max_retries:
+                return response
+            retry_after = get_retry_after(response)
+            delay = retry_after + random.uniform(0, 1) if retry_after is not None else get_backoff(attempt)
+            print(f'{response.status_code} from {host}, retrying in {delay:.1f} seconds (attempt {attempt + 1} of {max_retries})')
+            ##throttled host: the limiter holds back this and every other caller, so no separate sleep
+            if limiter and response.status_code == 429:
+                limiter.pause(delay)
+                continue
+        time.sleep(delay)
+# Adds a response to the per-host transfer totals (bytes on the wire where the server reports them, otherwise decoded bytes)
+##a streamed body is not read here, so without Content-Length its size is not counted
+def record_transfer(host, response, stream=False):
+    size = response.headers.get('Content-Length')
+    size = int(size) if size and size.isdigit() else 0 if stream else len(response.content)
+    with _transfer_lock:
+        stats = _transfer_stats.setdefault(host, {'requests': 0, 'bytes': 0, 'seconds': 0.0})
+        stats['requests'] += 1
+        stats['bytes'] += size
+        stats['seconds'] += response.elapsed.total_seconds()
+# Returns request count, bytes, and average seconds per request for each host
+def get_transfer_stats():
+    with _transfer_lock:
+        return {host: {**stats, 'seconds_per_request': round(stats['seconds'] / stats['requests'], 3)} for host, stats in _transfer_stats.items()}
+# Sends GET request through the shared session, coalescing duplicates: callers asking for a URL + params + headers + options already in flight wait for that request, and the most recent successful responses are reused for recent_ttl seconds
+#streamed requests (stream=True, e.g., file downloads) bypass coalescing and both caches, since their body is read once by the caller and may be large
+def http_get(url, params=None, headers=None, timeout=None, **kwargs):
+    if kwargs.get('stream'):
+        return http_request('GET', url, params=params, headers=headers, timeout=timeout, **kwargs)
+    key, cache_url = get_cache_key(url, params)
+    ##requests that differ only in headers (e.g., with and without an API key, or another Accept type) or in request options (allow_redirects, timeout, ...) are kept apart
+    if headers or kwargs or timeout is not None:
+        options = [sorted((headers or {}).items()), timeout, sorted(kwargs.items())]
+        key = hashlib.sha256((key + json.dumps(options, default=str)).encode('utf-8')).hexdigest()
+    with _coalesce_lock:
+        _coalesce_stats['requests'] += 1
+        if key in _recent_responses:
+            received, response = _recent_responses[key]
+            if time.monotonic() - received <= _http_settings['recent_ttl']:
+                _recent_responses.move_to_end(key)
+                _coalesce_stats['suppressed'] += 1
+                return response
+            del _recent_responses[key]
+        future = _in_flight.get(key)
+        leader = future is None
+        if leader:
+            future = _in_flight[key] = Future()
+        else:
+            _coalesce_stats['suppressed'] += 1
+    if not leader:
+        return future.result()
+
+    try:
+        response = http_get_cached(key, cache_url, url, params=params, headers=headers, timeout=timeout, **kwargs)
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _coalesce_lock:
+            _in_flight.pop(key, None)
+    future.set_result(response)
+    if response.status_code == 200:
+        with _coalesce_lock:
+            _recent_responses[key] = (time.monotonic(), response)
+            while len(_recent_responses) > _http_settings['recent_responses']:
+                _recent_responses.popitem(last=False)
+    return response
+# Returns the number of GET requests and of duplicates answered without a new request
+def get_coalesce_stats():
+    with _coalesce_lock:
+        return dict(_coalesce_stats)
+# Sends GET request, served from the on-disk cache when enabled
+def http_get_cached(key, cache_url, url, params=None, headers=None, timeout=None, **kwargs):
+    if _cache_dir is None:
+        return http_request('GET', url, params=params, headers=headers, timeout=timeout, **kwargs)
+    response = read_cached_response(key, cache_url)
+    if response is not None:
+        return response
+    if _cache_settings['offline']:
+        raise requests.ConnectionError(f'Offline mode: {cache_url} is not in the cache')
+    response = http_request('GET', url, params=params, headers=headers, timeout=timeout, **kwargs)
+    if response.status_code == 200:
+        write_cached_response(key, cache_url, response)
+    return response
+# Sends HEAD request through the shared session
+def http_head(url, params=None, headers=None, timeout=None, **kwargs):
+    return http_request('HEAD', url, params=params, headers=headers, timeout=timeout, **kwargs)
+
+### Response cache ###
+#GET responses are stored under a hash of the URL and normalized parameters (secrets removed), one gzip file per response
+
+# Default cache settings (can be overridden with the 'cache' block under 'HTTP' in env.json)
+CACHE_DEFAULTS = {
+    'enabled': False,
+    'ttl': 86400,
+    'host_ttls': {},
+    'max_size_mb': 2048,
+    'offline': False,
+    'exclude_params': ['access_token', 'api_key', 'apikey', 'key', 'token', 'mailto']
+}
+
+_cache_dir = None
+_cache_settings = dict(CACHE_DEFAULTS)
+_cache_lock = threading.Lock()
+_cache_size = 0
+_cache_stats = {'hits': 0, 'misses': 0, 'stale': 0, 'stores': 0, 'evictions': 0}
+
+# Enables the on-disk response cache in the given directory (disabled unless 'enabled' or 'offline' is set)
+def configure_cache(directory, settings=None):
+    global _cache_dir, _cache_settings, _cache_size
+    _cache_settings = {**CACHE_DEFAULTS, **(settings or {})}
+    for stat in _cache_stats:
+        _cache_stats[stat] = 0
+    if not (_cache_settings['enabled'] or _cache_settings['offline']):
+        _cache_dir = None
+        return None
+    _cache_dir = Path(directory)
+    _cache_dir.mkdir(parents=True, exist_ok=True)
+    _cache_size = sum(path.stat().st_size for path in _cache_dir.glob('*/*.gz'))
+    mode = 'offline (cache only)' if _cache_settings['offline'] else 'enabled'
+    print(f'HTTP cache {mode}: {_cache_dir} ({_cache_size / 1e6:.1f} MB)\n')
+    return _cache_dir
+# Builds cache key from URL plus sorted parameters, leaving out credentials
+def get_cache_key(url, params=None):
+    parsed = urlparse(url)
+    query = parse_qsl(parsed.query, keep_blank_values=True)
+    if params:
+        query += [(key, str(v)) for key, value in params.items() for v in (value if isinstance(value, (list, tuple)) else [value])]
+    exclude = set(_cache_settings['exclude_params'])
+    query = sorted((key, value) for key, value in query if key not in exclude)
+    cache_url = urlunparse(parsed._replace(query=urlencode(query)))
+    return hashlib.sha256(cache_url.encode('utf-8')).hexdigest(), cache_url
+# Returns the path of a cache entry (two-character subdirectories keep directories small)
+def get_cache_path(key):
+    return _cache_dir / key[:2] / f'{key}.gz'
+# Returns time-to-live in seconds for a URL (per-host override or global default)
+def get_cache_ttl(url):
+    host = urlparse(url).netloc
+    return _cache_settings['host_ttls'].get(host, _cache_settings['ttl'])
+# Reads a cached response, or returns None if missing or expired (expired entries are still used in offline mode)
+def read_cached_response(key, cache_url):
+    path = get_cache_path(key)
+    try:
+        with gzip.open(path, 'rb') as f:
+            meta, content = f.read().split(b'\n', 1)
+        meta = json.loads(meta)
+    except (OSError, ValueError, EOFError):
+        with _cache_lock:
+            _cache_stats['misses'] += 1
+        return None
+    if time.time() - meta['created'] > get_cache_ttl(cache_url) and not _cache_settings['offline']:
+        with _cache_lock:
+            _cache_stats['misses'] += 1
+            _cache_stats['stale'] += 1
+        return None
+    ##marking as recently used for eviction
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+    with _cache_lock:
+        _cache_stats['hits'] += 1
+
+    response = requests.Response()
+    response.status_code = meta['status']
+    response.headers = CaseInsensitiveDict(meta['headers'])
+    response.url = meta['url']
+    response.encoding = meta.get('encoding')
+    response._content = content
+    return response
+# Stores a response body with its status and content type (written to a temporary file and renamed, so readers never see partial entries)
+def write_cached_response(key, cache_url, response):
+    global _cache_size
+    path = get_cache_path(key)
+    meta = {
+        'url': cache_url,
+        'status': response.status_code,
+        'headers': {name: value for name, value in response.headers.items() if name.lower() == 'content-type'},
+        'encoding': response.encoding,
+        'created': time.time()
+    }
+    try:
+        path.parent.mkdir(exist_ok=True)
+        temp_path = path.with_name(f'{path.name}.{threading.get_ident()}.tmp')
+        with gzip.open(temp_path, 'wb') as f:
+            f.write(json.dumps(meta).encode('utf-8') + b'\n' + response.content)
+        size = temp_path.stat().st_size
+        old_size = path.stat().st_size if path.exists() else 0
+        os.replace(temp_path, path)
+    except OSError as e:
+        print(f'Error writing cache entry for {cache_url}: {e}')
+        return
+    with _cache_lock:
+        _cache_stats['stores'] += 1
+        _cache_size += size - old_size
+        over_limit = _cache_size > _cache_settings['max_size_mb'] * 1e6
+    if over_limit:
+        evict_cache()
+# Removes least recently used entries until the cache is back under 90% of its size limit
+def evict_cache():
+    global _cache_size
+    with _cache_lock:
+        entries = []
+        for path in _cache_dir.glob('*/*.gz'):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+        _cache_size = sum(size for _, size, _ in entries)
+        target = _cache_settings['max_size_mb'] * 1e6 * 0.9
+        for _, size, path in entries:
+            if _cache_size <= target:
+                break
+            try:
+                path.unlink()
+            except OSError:
+                continue
+            _cache_size -= size
+            _cache_stats['evictions'] += 1
+# Returns cache hit/miss counts for the run summary
+def get_cache_stats():
+    with _cache_lock:
+        return dict(_cache_stats, enabled=_cache_dir is not None, offline=_cache_settings['offline'], size_mb=round(_cache_size / 1e6, 1))
+
+### Checkpoints ###
+#responses received by each pager (and lookup loop) are appended to a gzipped JSON Lines file as they arrive, so an interrupted run replays them from disk and continues from the last page received
+
+_checkpoint_dir = None
+_checkpoint_max_age = None
+_checkpoints = {}
+_checkpoints_lock = threading.Lock()
+
+# Default age in days after which a checkpoint left by an interrupted run is discarded instead of replayed (same as PROBE_TTL_NEGATIVE)
+CHECKPOINT_MAX_AGE_DAYS = 7
+
+# Append-only record of the responses received for one query, keyed by request (first line records when the checkpoint was started)
+#pages are only held in memory until replayed (retain=False); small lookup results stay available for repeated requests (retain=True)
+##each response is its own gzip member, so a write cut short by a crash only loses that response
+class Checkpoint:
+    def __init__(self, path, retain=False, max_age=None):
+        self.path = path
+        self.retain = retain
+        self.entries = {}
+        self.lock = threading.Lock()
+        created = None
+        truncated = False
+        if path.exists():
+            try:
+                with gzip.open(path, 'rt', encoding='utf-8') as f:
+                    for line in f:
+                        try:
+                            entry = json.loads(line)
+                        except ValueError:
+                            continue
+                        if 'created' in entry:
+                            created = entry['created']
+                        elif 'key' in entry:
+                            self.entries[entry['key']] = entry['data']
+            except (EOFError, OSError):
+                ##last response may be incomplete if the run was killed while writing
+                truncated = True
+            stale = None
+            if created is None:
+                stale = 'no start time recorded'
+            elif max_age is not None and time.time() - created > max_age:
+                stale = f'started more than {max_age / 86400:g} days ago'
+            if stale:
+                print(f'Discarding checkpoint {path.name}: {stale}\n')
+                self.entries.clear()
+                path.unlink()
+            else:
+                print(f'Resuming from checkpoint {path.name}: {len(self.entries)} responses already received\n')
+                if truncated:
+                    self.rewrite(created)
+        if not path.exists():
+            self.rewrite(time.time())
+
+    # Writes the start time and the responses held in memory to a fresh file (replaced in one step)
+    def rewrite(self, created):
+        temp_path = self.path.with_suffix('.tmp')
+        with gzip.open(temp_path, 'wt', encoding='utf-8') as f:
+            f.write(json.dumps({'created': created}) + '\n')
+            for key, data in self.entries.items():
+                f.write(json.dumps({'key': key, 'data': data}) + '\n')
+        os.replace(temp_path, self.path)
+
+    # Returns a recorded response, or None if the request has not completed yet
+    def get(self, key):
+        if self.retain:
+            return self.entries.get(key)
+        with self.lock:
+            return self.entries.pop(key, None)
+
+    # Records a response (flushed immediately so it survives a crash)
+    def add(self, key, data):
+        with self.lock:
+            if self.retain:
+                self.entries[key] = data
+            with gzip.open(self.path, 'at', encoding='utf-8') as f:
+                f.write(json.dumps({'key': key, 'data': data}) + '\n')
+
+# Enables checkpoints in the given directory; checkpoints older than max_age_days are discarded when opened
+def configure_checkpoints(directory, max_age_days=CHECKPOINT_MAX_AGE_DAYS):
+    global _checkpoint_dir, _checkpoint_max_age
+    _checkpoints.clear()
+    _checkpoint_max_age = max_age_days * 86400 if max_age_days is not None else None
+    _checkpoint_dir = Path(directory) if directory else None
+    if _checkpoint_dir is not None:
+        _checkpoint_dir.mkdir(parents=True, exist_ok=True)
+    return _checkpoint_dir
+# Returns the checkpoint for a query, identified by source name and query fingerprint (None if checkpoints are disabled)
+def open_checkpoint(source, url, params=None, retain=False):
+    if _checkpoint_dir is None:
+        return None
+    path = _checkpoint_dir / f'{source}-{get_query_fingerprint(url, params or {})[:16]}.jsonl.gz'
+    with _checkpoints_lock:
+        if path not in _checkpoints:
+            _checkpoints[path] = Checkpoint(path, retain, _checkpoint_max_age)
+        return _checkpoints[path]
+# Retrieves a page through a checkpoint: recorded pages are replayed, new pages are recorded (failed pages are not, so they are retried on resume)
+#failed pages go to the dead-letter queue and leave it once they succeed
+##auth names the credential (see CREDENTIALS) the request needs, so a replay of a failed page can add it back
+def retrieve_page_checkpointed(checkpoint, retrieve_page_func, url, params=None, *args, auth=None):
+    key = get_cache_key(url, params)[0]
+    data = checkpoint.get(key) if checkpoint is not None else None
+    if data is None:
+        data = retrieve_page_func(url, params, *args)
+        if 'error' in data:
+            record_dead_letter(url, params, data['error'], checkpoint, key, auth)
+        else:
+            resolve_dead_letter(key)
+            if checkpoint is not None:
+                checkpoint.add(key, data)
+    return data
+# Deletes all checkpoints after a run has completed
+def clear_checkpoints():
+    with _checkpoints_lock:
+        _checkpoints.clear()
+        if _checkpoint_dir is not None:
+            for path in _checkpoint_dir.glob('*.jsonl*'):
+                path.unlink()
+
+### Dead-letter queue ###
+#requests that still fail after retries are kept in a JSON Lines file (one entry per request, credentials removed) so they can be replayed on their own with accessory-scripts/redrive-dead-letters.py
+
+_dead_letter_path = None
+_dead_letters = {}
+_dead_letter_lock = threading.Lock()
+_dead_letter_stats = {'recorded': 0, 'resolved': 0}
+#credentials removed from queued requests, by name: where each goes in the request and which env['KEYS'] entry holds it
+CREDENTIALS = {
+    'zenodo': {'param': 'access_token', 'key': 'zenodo_token'},
+    'dataverse': {'header': 'X-Dataverse-key', 'key': 'dataverse_token'}
+}
+
+# Enables the dead-letter queue at the given path, keeping entries left by earlier runs
+def configure_dead_letters(path):
+    global _dead_letter_path
+    _dead_letters.clear()
+    for stat in _dead_letter_stats:
+        _dead_letter_stats[stat] = 0
+    _dead_letter_path = Path(path) if path else None
+    if _dead_letter_path is None:
+        return None
+    _dead_letter_path.parent.mkdir(parents=True, exist_ok=True)
+    _dead_letters.update(load_dead_letters(_dead_letter_path))
+    if _dead_letters:
+        print(f'{len(_dead_letters)} failed requests from earlier runs in dead-letter queue {_dead_letter_path.name}\n')
+    return _dead_letter_path
+# Reads dead-letter entries from a JSON Lines file, keyed by request
+def load_dead_letters(path):
+    letters = {}
+    if Path(path).exists():
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                letters[entry['key']] = entry
+    return letters
+# Writes dead-letter entries (replaced in one step so a crash never leaves a half-written file); the file is removed once the queue is empty
+def save_dead_letters(letters, path):
+    path = Path(path)
+    if not letters:
+        path.unlink(missing_ok=True)
+        return
+    temp_path = path.with_suffix('.tmp')
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        for entry in letters.values():
+            f.write(json.dumps(entry) + '\n')
+    os.replace(temp_path, path)
+# Removes credentials from a URL's query string and from a parameter dict
+def strip_secrets(url, params=None):
+    exclude = set(_cache_settings['exclude_params'])
+    parsed = urlparse(url)
+    if parsed.query:
+        query = [(key, value) for key, value in parse_qsl(parsed.query, keep_blank_values=True) if key not in exclude]
+        url = urlunparse(parsed._replace(query=urlencode(query)))
+    return url, {key: value for key, value in (params or {}).items() if key not in exclude}
+# Masks credentials in text such as error messages, which can include the full request URL
+def redact_secrets(text):
+    pattern = r'\b(' + '|'.join(map(re.escape, _cache_settings['exclude_params'])) + r')=[^&\s]*'
+    return re.sub(pattern, r'\1=***', str(text))
+# Records a failed request (or one more failed attempt of a queued request), with the checkpoint and key its response belongs under and the credential it needs
+def record_dead_letter(url, params, error, checkpoint=None, checkpoint_key=None, auth=None):
+    if _dead_letter_path is None:
+        return
+    key = get_cache_key(url, params)[0]
+    url, params = strip_secrets(url, params)
+    error = redact_secrets(error)
+    now = time.strftime('%Y-%m-%dT%H:%M:%S')
+    with _dead_letter_lock:
+        entry = _dead_letters.get(key) or {'key': key, 'url': url, 'params': params, 'attempts': 0, 'first_failed': now}
+        entry.update({
+            'error': error,
+            'attempts': entry['attempts'] + 1,
+            'last_failed': now,
+            'checkpoint': checkpoint.path.name if checkpoint is not None else None,
+            'checkpoint_key': checkpoint_key,
+            'auth': auth
+        })
+        _dead_letters[key] = entry
+        _dead_letter_stats['recorded'] += 1
+        save_dead_letters(_dead_letters, _dead_letter_path)
+# Removes a request from the dead-letter queue once it has succeeded
+def resolve_dead_letter(key):
+    if key not in _dead_letters:
+        return
+    with _dead_letter_lock:
+        if _dead_letters.pop(key, None) is not None:
+            _dead_letter_stats['resolved'] += 1
+            save_dead_letters(_dead_letters, _dead_letter_path)
+# Returns failures recorded and resolved during this run, plus the number of requests still queued
+def get_dead_letter_stats():
+    return {**_dead_letter_stats, 'queued': len(_dead_letters)}
+
+### Asynchronous engine ###
+#all async retrieval shares one event loop running in a background thread; blocking HTTP calls run in a bounded worker pool
+
+_loop = None
+_loop_thread = None
+_progress_lock = threading.Lock()
+
+# Prints a progress message prefixed with the source it belongs to (under one lock, so lines from concurrent harvests stay whole)
+def log_progress(label, message):
+    with _progress_lock:
+        print(f'[{label}] {message}')
+# Returns the shared event loop, starting it on first use
+def get_event_loop():
+    global _loop, _loop_thread
+    if _loop is None:
+        _loop = asyncio.new_event_loop()
+        _loop.set_default_executor(ThreadPoolExecutor(max_workers=_http_settings['max_workers'], thread_name_prefix='retrieval'))
+        _loop_thread = threading.Thread(target=_loop.run_forever, name='retrieval-loop', daemon=True)
+        _loop_thread.start()
+    return _loop
+# Runs coroutine on the shared event loop and blocks until it finishes (synchronous wrapper; also works inside Jupyter)
+def run_async(coro):
+    loop = get_event_loop()
+    if threading.current_thread() is _loop_thread:
+        coro.close()
+        raise RuntimeError('run_async() cannot be called from the retrieval event loop; await the coroutine instead')
+    return asyncio.run_coroutine_threadsafe(coro, loop).result()
+# Runs blocking function in the worker pool without blocking the event loop
+async def to_thread(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, partial(func, *args, **kwargs))
+# Runs coroutines with at most max_concurrency in flight, returning results in input order
+async def gather_limited(coros, max_concurrency):
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+    async def limited(coro):
+        async with semaphore:
+            return await coro
+    return await asyncio.gather(*(limited(coro) for coro in coros))
+# Sends GET request through the shared session from a coroutine
+async def http_get_async(url, params=None, headers=None, timeout=None, **kwargs):
+    return await to_thread(http_get, url, params=params, headers=headers, timeout=timeout, **kwargs)
+# Fetches a planned list of pages (one params dict per page) with at most max_concurrency in flight, yielding responses in plan order as they complete
+async def iter_page_plan_async(retrieve_page_func, url, page_params, max_concurrency, *args, checkpoint=None, auth=None):
+    plan = iter(page_params)
+    def fetch(params):
+        return asyncio.ensure_future(to_thread(retrieve_page_checkpointed, checkpoint, retrieve_page_func, url, params, *args, auth=auth))
+    in_flight = deque(fetch(params) for params in islice(plan, max(1, max_concurrency)))
+    try:
+        while in_flight:
+            page = await in_flight.popleft()
+            for params in islice(plan, 1):
+                in_flight.append(fetch(params))
+            yield page
+    finally:
+        for task in in_flight:
+            task.cancel()
+# Passes a page of records on: to the on_page callback when streaming, otherwise into the accumulated list
+async def emit_records(records, all_data, on_page):
+    if on_page is None:
+        all_data.extend(records)
+    else:
+        await on_page(records)
+# Runs an async pager with an on_page callback and yields its pages as they arrive (synchronous generator)
+#the pager keeps up to 'prefetch_pages' pages queued ahead of the consumer, so the next requests overlap with processing of the current page, and pauses when the queue is full
+def stream_pages(pager_async, *args, **kwargs):
+    loop = get_event_loop()
+    if threading.current_thread() is _loop_thread:
+        raise RuntimeError('stream_pages() cannot be called from the retrieval event loop; pass on_page to the pager instead')
+    pages = asyncio.Queue(maxsize=max(1, _http_settings['prefetch_pages']))
+
+    async def produce():
+        try:
+            await pager_async(*args, on_page=pages.put, **kwargs)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            await pages.put(e)
+            return
+        await pages.put(None)
+
+    producer = asyncio.run_coroutine_threadsafe(produce(), loop)
+    try:
+        while True:
+            page = asyncio.run_coroutine_threadsafe(pages.get(), loop).result()
+            if page is None:
+                break
+            if isinstance(page, Exception):
+                raise page
+            yield page
+    finally:
+        producer.cancel()
+# Flattens a stream of pages into a stream of records
+def iter_records(pages):
+    for page in pages:
+        yield from page
+# Starts independent harvests at the same time, one thread each (so synchronous wrappers and incremental retrievals can be mixed), and returns their futures keyed by label
+#the threads only wait on the shared event loop, so the page requests of all harvests share its worker pool and per-host rate limits
+def start_harvests(harvests):
+    def timed(label, retrieve_func):
+        start = time.monotonic()
+        records = retrieve_func()
+        log_progress(label, f'Harvest finished: {len(records)} records in {time.monotonic() - start:.1f} seconds\n')
+        return records
+    executor = ThreadPoolExecutor(max_workers=max(1, len(harvests)), thread_name_prefix='harvest')
+    futures = {label: executor.submit(timed, label, retrieve_func) for label, retrieve_func in harvests.items()}
+    executor.shutdown(wait=False)
+    return futures
+
+# Waits for harvests started with start_harvests and returns their records keyed by label
+##a failed harvest is logged and returns no records, so the other sources still reach the rest of the workflow
+def join_harvests(futures):
+    harvested = {}
+    for label, future in futures.items():
+        try:
+            harvested[label] = future.result()
+        except Exception as e:
+            log_progress(label, f'Harvest failed, continuing without these records: {redact_secrets(e)}\n')
+            harvested[label] = []
+    return harvested
+
 ### API retrieval functions ###
 
 # Retrieves single page of Dryad results
 def retrieve_page_dryad(url, params):
     try:
-        response = requests.get(url, params=params)
+        response = http_get(url, params=params)
         response.raise_for_status()
-        return response.json()
+        return decode_response(response, 'dryad')
     except requests.RequestException as e:
         print(f'Error retrieving page: {e}')
-        return {'_embedded': {'stash:datasets': []}, 'total': {}}
-# Retrieves all pages of Dryad results
-def retrieve_dryad(url, params, page_start, per_page):
+        return {**{'_embedded': {'stash:datasets': []}, 'total': {}}, 'error': str(e)}
+# Retrieves all pages of Dryad results (max_concurrency > 1 fetches remaining pages in parallel once the total is known)
+async def retrieve_dryad_async(url, params, page_start, per_page, max_concurrency=1, label='Dryad', on_page=None):
     all_data_dryad = []
+    checkpoint = open_checkpoint('dryad', url, params)
     params = params.copy()
     params['page'] = page_start
     params['per_page'] = per_page
 
-    data = retrieve_page_dryad(url, params)
+    data = await to_thread(retrieve_page_checkpointed, checkpoint, retrieve_page_dryad, url, params)
     total_count = data.get('total', 0)
     total_pages = math.ceil(total_count / per_page) if per_page else 1
 
-    print(f'Total: {total_count} entries over {total_pages} pages\n')
+    log_progress(label, f'Total: {total_count} entries over {total_pages} pages\n')
+
+    if max_concurrency > 1:
+        if not data.get('_embedded'):
+            log_progress(label, 'No data found.')
+            return all_data_dryad
+        await emit_records(data['_embedded'].get('stash:datasets', []), all_data_dryad, on_page)
+        page_params = [{**params, 'page': page} for page in range(page_start + 1, total_pages + 1)]
+        log_progress(label, f'Retrieving remaining {len(page_params)} pages ({max_concurrency} in parallel)...\n')
+        async for page in iter_page_plan_async(retrieve_page_dryad, url, page_params, max_concurrency, checkpoint=checkpoint):
+            await emit_records(page.get('_embedded', {}).get('stash:datasets', []), all_data_dryad, on_page)
+        log_progress(label, 'End of response.\n')
+        return all_data_dryad
 
     while True:
-        print(f'Retrieving page {params["page"]} of {total_pages} from Dryad...\n')
-        data = retrieve_page_dryad(url, params)
+        log_progress(label, f'Retrieving page {params["page"]} of {total_pages}...\n')
+        ##the first page was already retrieved for the total
+        if params['page'] != page_start:
+            data = await to_thread(retrieve_page_checkpointed, checkpoint, retrieve_page_dryad, url, params)
 
         if not data.get('_embedded'):
-            print('No data found.')
+            log_progress(label, 'No data found.')
             return all_data_dryad
 
         datasets = data['_embedded'].get('stash:datasets', [])
-        all_data_dryad.extend(datasets)
+        await emit_records(datasets, all_data_dryad, on_page)
 
         params['page'] += 1
 
         if not datasets or params['page'] > total_pages:
-            print('End of Dryad response.\n')
+            log_progress(label, 'End of response.\n')
             break
 
     return all_data_dryad
-
+# Synchronous wrapper for retrieve_dryad_async
+def retrieve_dryad(url, params, page_start, per_page, max_concurrency=1, label='Dryad'):
+    return run_async(retrieve_dryad_async(url, params, page_start, per_page, max_concurrency, label))
+# Streaming variant of retrieve_dryad (yields pages of records as they arrive)
+def iter_dryad(url, params, page_start, per_page, max_concurrency=1, label='Dryad'):
+    return stream_pages(retrieve_dryad_async, url, params, page_start, per_page, max_concurrency, label)
+
+# DataCite attributes read when building dataframes (requested as a sparse fieldset in lean mode)
+DATACITE_FIELDS = [
+    'doi', 'state', 'publisher', 'registered', 'publicationYear', 'updated', 'titles', 'creators', 'contributors',
+    'relatedIdentifiers', 'container', 'types', 'subjects', 'sizes', 'formats', 'rightsList',
+    'viewCount', 'downloadCount', 'citationCount'
+]
+
+# Restricts a DataCite query to the attributes the workflow reads and turns off facet computation
+def lean_datacite_params(params, fields=DATACITE_FIELDS):
+    return {**params, 'fields[dois]': ','.join(fields), 'disable-facets': 'true'}
 # Retrieves single page of DataCite results
 def retrieve_page_datacite(url, params=None):
     try:
-        response = requests.get(url, params=params)
+        response = http_get(url, params=params)
         response.raise_for_status()
-        return response.json()
+        return decode_response(response, 'datacite')
     except requests.RequestException as e:
         print(f'Error retrieving page: {e}')
-        return {'data': [], 'links': {}}
+        return {**{'data': [], 'links': {}}, 'error': str(e)}
 # Retrieves all pages of DataCite results
-def retrieve_datacite(url, params, page_start, page_limit, per_page):
+async def retrieve_datacite_async(url, params, page_start, page_limit, per_page, label='DataCite', on_page=None):
     all_data_datacite = []
+    checkpoint = open_checkpoint('datacite', url, params)
     current_page = page_start
 
-    data = retrieve_page_datacite(url, params)
+    data = await to_thread(retrieve_page_checkpointed, checkpoint, retrieve_page_datacite, url, params)
     if not data['data']:
-        print('No data found.')
+        log_progress(label, 'No data found.')
         return all_data_datacite
 
-    all_data_datacite.extend(data['data'])
+    await emit_records(data['data'], all_data_datacite, on_page)
 
     total_count = data.get('meta', {}).get('total', 0)
     total_pages = math.ceil(total_count / per_page) if per_page else 1
@@ -79,15 +834,98 @@ def retrieve_datacite(url, params, page_start, page_limit, per_page):
 
     while current_url and current_page < page_limit:
         current_page += 1
-        print(f'Retrieving page {current_page} of {total_pages} from DataCite...\n')
-        data = retrieve_page_datacite(current_url)
+        log_progress(label, f'Retrieving page {current_page} of {total_pages}...\n')
+        data = await to_thread(retrieve_page_checkpointed, checkpoint, retrieve_page_datacite, current_url)
         if not data['data']:
-            print('End of response.')
+            log_progress(label, 'End of response.')
             break
-        all_data_datacite.extend(data['data'])
+        await emit_records(data['data'], all_data_datacite, on_page)
         current_url = data.get('links', {}).get('next', None)
 
     return all_data_datacite
+# Synchronous wrapper for retrieve_datacite_async
+def retrieve_datacite(url, params, page_start, page_limit, per_page, label='DataCite'):
+    return run_async(retrieve_datacite_async(url, params, page_start, page_limit, per_page, label))
+# Streaming variant of retrieve_datacite (yields pages of records as they arrive)
+def iter_datacite(url, params, page_start, page_limit, per_page, label='DataCite'):
+    return stream_pages(retrieve_datacite_async, url, params, page_start, page_limit, per_page, label)
+# Splits a DataCite query into disjoint publicationYear ranges of roughly equal size, using the 'published' facet from a one-record preflight
+def plan_datacite_partitions(url, params, partitions):
+    ##nothing to split, so the preflight request is skipped
+    if partitions <= 1:
+        return [], None
+    ##the preflight needs the 'published' facet, so facets stay on even in lean mode
+    preflight_params = {key: value for key, value in params.items() if key not in ('page[cursor]', 'disable-facets')}
+    preflight_params['page[size]'] = 1
+    data = retrieve_page_checkpointed(open_checkpoint('datacite-plan', url, params), retrieve_page_datacite, url, preflight_params)
+    total_count = data.get('meta', {}).get('total', 0)
+    year_counts = sorted((int(year['id']), year.get('count', 0)) for year in data.get('meta', {}).get('published', []) if str(year.get('id', '')).isdigit())
+    if len(year_counts) < 2:
+        return [], total_count
+
+    #greedy split of consecutive years into shards close to the target size
+    target = sum(count for _, count in year_counts) / partitions
+    upper_bounds = []
+    running = 0
+    for year, count in year_counts[:-1]:
+        running += count
+        if running >= target * (len(upper_bounds) + 1) and len(upper_bounds) < partitions - 1:
+            upper_bounds.append(year)
+
+    #open-ended first and last ranges keep the shards exhaustive even if the facet omits some years
+    ranges = []
+    lower = '*'
+    for upper in upper_bounds:
+        ranges.append((lower, upper))
+        lower = upper + 1
+    ranges.append((lower, '*'))
+    return ranges, total_count
+# Retrieves all pages of a DataCite query as parallel cursors over publicationYear partitions, de-duplicating DOIs on merge
+async def retrieve_datacite_partitioned_async(url, params, page_start, page_limit, per_page, partitions, label='DataCite', on_page=None):
+    ranges, total_count = await to_thread(plan_datacite_partitions, url, params, partitions)
+    if not ranges:
+        return await retrieve_datacite_async(url, params, page_start, page_limit, per_page, label, on_page)
+
+    log_progress(label, f'Total: {total_count} entries split into {len(ranges)} publication year partitions\n')
+    ##the page limit is a budget for the whole query, so it is shared between the partitions
+    page_limit = page_start + max(1, math.ceil((page_limit - page_start) / len(ranges)))
+    shard_params = [{**params, 'query': f'({params["query"]}) AND publicationYear:[{lower} TO {upper}]'} for lower, upper in ranges]
+
+    all_data_datacite = []
+    seen_dois = set()
+    def unseen(items):
+        new_items = []
+        for item in items:
+            doi = item.get('id') or item.get('attributes', {}).get('doi')
+            if doi in seen_dois:
+                continue
+            seen_dois.add(doi)
+            new_items.append(item)
+        return new_items
+
+    ##streaming: pages from all partitions are passed on as they arrive
+    if on_page is not None:
+        async def merge_page(items):
+            await on_page(unseen(items))
+        await asyncio.gather(*(
+            retrieve_datacite_async(url, shard, page_start, page_limit, per_page, label=f'{label} (published {lower}-{upper})', on_page=merge_page)
+            for shard, (lower, upper) in zip(shard_params, ranges)
+        ))
+        return all_data_datacite
+
+    shards = await asyncio.gather(*(
+        retrieve_datacite_async(url, shard, page_start, page_limit, per_page, label=f'{label} (published {lower}-{upper})')
+        for shard, (lower, upper) in zip(shard_params, ranges)
+    ))
+    for shard in shards:
+        all_data_datacite.extend(unseen(shard))
+    return all_data_datacite
+# Synchronous wrapper for retrieve_datacite_partitioned_async
+def retrieve_datacite_partitioned(url, params, page_start, page_limit, per_page, partitions, label='DataCite'):
+    return run_async(retrieve_datacite_partitioned_async(url, params, page_start, page_limit, per_page, partitions, label))
+# Streaming variant of retrieve_datacite_partitioned (yields pages of records as they arrive)
+def iter_datacite_partitioned(url, params, page_start, page_limit, per_page, partitions, label='DataCite'):
+    return stream_pages(retrieve_datacite_partitioned_async, url, params, page_start, page_limit, per_page, partitions, label)
 # Retrieves all pages of DataCite aggregate metadata
 def retrieve_datacite_summary(url, params, publisher, affiliated, institution):
     all_resource_types = []
@@ -119,111 +957,151 @@ def retrieve_datacite_summary(url, params, publisher, affiliated, institution):
 # Retrieves single page of Dataverse results
 def retrieve_page_dataverse(url, params=None, headers=None):
     try:
-        response = requests.get(url, params=params, headers=headers)
+        response = http_get(url, params=params, headers=headers)
         response.raise_for_status()
-        return response.json()
+        return decode_response(response, 'dataverse')
     except requests.RequestException as e:
         print(f'Error retrieving page: {e}')
-        return {'data': {'items': [], 'total_count': 0}}
-# Retrieves all pages of DataCite results
-def retrieve_dataverse(url, params, headers, page_start, per_page):
+        return {**{'data': {'items': [], 'total_count': 0}}, 'error': str(e)}
+# Retrieves all pages of Dataverse results (max_concurrency > 1 fetches remaining pages in parallel once the total is known)
+async def retrieve_dataverse_async(url, params, headers, page_start, per_page, max_concurrency=1, label='Dataverse', on_page=None):
     all_data_dataverse = []
+    checkpoint = open_checkpoint('dataverse', url, params)
+    auth = 'dataverse' if headers else None
     params = params.copy()
     params['start'] = page_start
     params['page'] = 1
 
+    if max_concurrency > 1:
+        data = await to_thread(retrieve_page_checkpointed, checkpoint, retrieve_page_dataverse, url, params, headers, auth=auth)
+        total_count = data['data']['total_count']
+        total_pages = math.ceil(total_count / per_page) if per_page else 1
+        await emit_records(data['data']['items'], all_data_dataverse, on_page)
+        page_params = [{**params, 'start': start, 'page': page} for page, start in enumerate(range(page_start + per_page, total_count, per_page), start=2)]
+        log_progress(label, f'Total: {total_count} entries over {total_pages} pages; retrieving remaining {len(page_params)} pages ({max_concurrency} in parallel)...\n')
+        async for page in iter_page_plan_async(retrieve_page_dataverse, url, page_params, max_concurrency, headers, checkpoint=checkpoint, auth=auth):
+            await emit_records(page['data']['items'], all_data_dataverse, on_page)
+        log_progress(label, 'End of response.')
+        return all_data_dataverse
+
     while True:
-        data = retrieve_page_dataverse(url, params, headers)
+        data = await to_thread(retrieve_page_checkpointed, checkpoint, retrieve_page_dataverse, url, params, headers, auth=auth)
         total_count = data['data']['total_count']
         total_pages = math.ceil(total_count / per_page) if per_page else 1
-        print(f'Retrieving page {params["page"]} of {total_pages} pages...\n')
+        log_progress(label, f'Retrieving page {params["page"]} of {total_pages} pages...\n')
 
         if not data['data']:
-            print('No data found.')
+            log_progress(label, 'No data found.')
             break
 
-        all_data_dataverse.extend(data['data']['items'])
+        await emit_records(data['data']['items'], all_data_dataverse, on_page)
 
         params['start'] += per_page
         params['page'] += 1
 
         if params['start'] >= total_count:
-            print('End of response.')
+            log_progress(label, 'End of response.')
             break
 
     return all_data_dataverse
+# Synchronous wrapper for retrieve_dataverse_async
+def retrieve_dataverse(url, params, headers, page_start, per_page, max_concurrency=1, label='Dataverse'):
+    return run_async(retrieve_dataverse_async(url, params, headers, page_start, per_page, max_concurrency, label))
+# Streaming variant of retrieve_dataverse (yields pages of records as they arrive)
+def iter_dataverse(url, params, headers, page_start, per_page, max_concurrency=1, label='Dataverse'):
+    return stream_pages(retrieve_dataverse_async, url, params, headers, page_start, per_page, max_concurrency, label)
 
 # Retrieves single page of Zenodo results
 def retrieve_page_zenodo(url, params=None):
     try:
-        response = requests.get(url, params=params, timeout=30)
+        response = http_get(url, params=params)
         response.raise_for_status()
-        return response.json()
+        return decode_response(response, 'zenodo')
     except requests.RequestException as e:
         print(f'Error retrieving page: {e}')
-        return {'hits': {'hits': [], 'total': {}}, 'links': {}}
+        return {**{'hits': {'hits': [], 'total': {}}, 'links': {}}, 'error': str(e)}
 # Retrieves page number in Zenodo query
 def extract_page_number(url):
     parsed_url = urlparse(url)
     query_params = parse_qs(parsed_url.query)
     return query_params.get('page', [None])[0]
-# Retrieves all pages of Zenodo results
-def retrieve_zenodo(url, params, page_start, page_limit, per_page):
+# Retrieves all pages of Zenodo results (max_concurrency > 1 fetches remaining pages in parallel by page number once the total is known)
+async def retrieve_zenodo_async(url, params, page_start, page_limit, per_page, max_concurrency=1, label='Zenodo', on_page=None):
     all_data_zenodo = []
+    checkpoint = open_checkpoint('zenodo', url, params)
+    auth = 'zenodo' if params.get('access_token') else None
     current_page = page_start
     params = params.copy()
     params['page'] = current_page
     params['size'] = per_page
 
-    data = retrieve_page_zenodo(url, params)
+    data = await to_thread(retrieve_page_checkpointed, checkpoint, retrieve_page_zenodo, url, params, auth=auth)
     if not data['hits']['hits']:
-        print('No data found.')
+        log_progress(label, 'No data found.')
         return all_data_zenodo
 
-    all_data_zenodo.extend(data['hits']['hits'])
+    await emit_records(data['hits']['hits'], all_data_zenodo, on_page)
 
-    current_url = data.get('links', {}).get('self', None)
+    ##continuing from the first page's 'next' link (the first page is not requested again)
+    current_url = data.get('links', {}).get('next', None)
     total_count = data.get('hits', {}).get('total', 0)
     total_pages = math.ceil(total_count / per_page) if per_page else 1
-    print(f'Total: {total_count} entries over {total_pages} pages\n')
+    log_progress(label, f'Total: {total_count} entries over {total_pages} pages\n')
+
+    if max_concurrency > 1:
+        ##Zenodo treats page 0 as page 1
+        first_page = max(page_start, 1)
+        page_params = [{**params, 'page': page} for page in range(first_page + 1, min(total_pages, page_limit) + 1)]
+        log_progress(label, f'Retrieving remaining {len(page_params)} pages ({max_concurrency} in parallel)...\n')
+        async for page in iter_page_plan_async(retrieve_page_zenodo, url, page_params, max_concurrency, checkpoint=checkpoint, auth=auth):
+            await emit_records(page['hits']['hits'], all_data_zenodo, on_page)
+        log_progress(label, 'End of response.\n')
+        return all_data_zenodo
 
+    ##Zenodo treats page 0 as page 1
+    current_page = max(page_start, 1)
     while current_url and current_page < page_limit:
-        print(f'Retrieving page {current_page} of {total_pages} from Zenodo...\n')
         current_page += 1
-        data = retrieve_page_zenodo(current_url, {'access_token': params['access_token']})
+        log_progress(label, f'Retrieving page {current_page} of {total_pages}...\n')
+        data = await to_thread(retrieve_page_checkpointed, checkpoint, retrieve_page_zenodo, current_url, {'access_token': params['access_token']}, auth=auth)
         if not data['hits']['hits']:
-            print('End of Zenodo response.\n')
+            log_progress(label, 'End of response.\n')
             break
 
-        all_data_zenodo.extend(data['hits']['hits'])
+        await emit_records(data['hits']['hits'], all_data_zenodo, on_page)
         current_url = data.get('links', {}).get('next', None)
 
     return all_data_zenodo
+# Synchronous wrapper for retrieve_zenodo_async
+def retrieve_zenodo(url, params, page_start, page_limit, per_page, max_concurrency=1, label='Zenodo'):
+    return run_async(retrieve_zenodo_async(url, params, page_start, page_limit, per_page, max_concurrency, label))
+# Streaming variant of retrieve_zenodo (yields pages of records as they arrive)
+def iter_zenodo(url, params, page_start, page_limit, per_page, max_concurrency=1, label='Zenodo'):
+    return stream_pages(retrieve_zenodo_async, url, params, page_start, page_limit, per_page, max_concurrency, label)
 
 # Retrieves single page of OpenAlex results
 def retrieve_page_openalex(url, params=None):
     try:
-        response = requests.get(url, params=params)
+        response = http_get(url, params=params)
         response.raise_for_status()
         return response.json()
     except requests.RequestException as e:
         print(f'Error retrieving page: {e}')
-        return {'results': [], 'meta': {}}
+        return {**{'results': [], 'meta': {}}, 'error': str(e)}
 # Retrieves all pages of OpenAlex results
-def retrieve_openalex(url, params, page_limit):
+async def retrieve_openalex_async(url, params, page_limit, on_page=None):
     all_data_openalex = []
+    checkpoint = open_checkpoint('openalex', url, params)
     params = params.copy()
     params['cursor'] = '*'
-    next_cursor = '*'
-    previous_cursor = None
-    current_page = 0
+    current_page = 1
 
-    data = retrieve_page_openalex(url, params)
+    data = await to_thread(retrieve_page_checkpointed, checkpoint, retrieve_page_openalex, url, params)
     if not data['results']:
         print('No data found.')
         return all_data_openalex
 
-    all_data_openalex.extend(data['results'])
+    await emit_records(data['results'], all_data_openalex, on_page)
 
     total_count = data.get('meta', {}).get('count', 0)
     per_page = data.get('meta', {}).get('per_page', 1)
@@ -231,13 +1109,15 @@ def retrieve_openalex(url, params, page_limit):
 
     print(f'Total: {total_count} entries over {total_pages} pages\n')
 
-    while current_page < page_limit:
+    ##continuing from the first page's cursor (the first page is not requested again)
+    params['cursor'] = data.get('meta', {}).get('next_cursor', None)
+    while params['cursor'] and current_page < page_limit:
         current_page += 1
         print(f'Retrieving page {current_page} of {total_pages} from OpenAlex...\n')
-        data = retrieve_page_openalex(url, params)
+        data = await to_thread(retrieve_page_checkpointed, checkpoint, retrieve_page_openalex, url, params)
         next_cursor = data.get('meta', {}).get('next_cursor', None)
 
-        if next_cursor == previous_cursor:
+        if next_cursor == params['cursor']:
             print('Cursor did not change. Ending loop to avoid infinite loop.')
             break
 
@@ -245,54 +1125,65 @@ def retrieve_openalex(url, params, page_limit):
             print('End of OpenAlex response.\n')
             break
 
-        all_data_openalex.extend(data['results'])
+        await emit_records(data['results'], all_data_openalex, on_page)
 
-        previous_cursor = next_cursor
         params['cursor'] = next_cursor
 
     return all_data_openalex
+# Synchronous wrapper for retrieve_openalex_async
+def retrieve_openalex(url, params, page_limit):
+    return run_async(retrieve_openalex_async(url, params, page_limit))
+# Streaming variant of retrieve_openalex (yields pages of records as they arrive)
+def iter_openalex(url, params, page_limit):
+    return stream_pages(retrieve_openalex_async, url, params, page_limit)
 
 # Retrieves single page of Crossref results
 def retrieve_page_crossref(url, params=None):
     try:
-        response = requests.get(url, params=params)
+        response = http_get(url, params=params)
         response.raise_for_status()
         return response.json()
     except requests.RequestException as e:
         print(f'Error retrieving page: {e}')
-        return {'message': {'items': [], 'total-results': {}}}
+        return {**{'message': {'items': [], 'total-results': {}}}, 'error': str(e)}
 # Retrieves all pages of Crossref results
-def retrieve_crossref(url, params, page_limit):
+async def retrieve_crossref_async(url, params, page_limit, on_page=None):
     all_data_crossref = []
+    checkpoint = open_checkpoint('crossref', url, params)
     params = params.copy()
     params['cursor'] = '*'
-    next_cursor = '*'
-    previous_cursor = None
     current_page = 1
 
-    data = retrieve_page_crossref(url, params)
+    data = await to_thread(retrieve_page_checkpointed, checkpoint, retrieve_page_crossref, url, params)
     if not data['message']['items']:
         print('No data found.')
         return all_data_crossref
 
-    all_data_crossref.extend(data['message']['items'])
+    await emit_records(data['message']['items'], all_data_crossref, on_page)
 
-    while current_page < page_limit:
+    ##continuing from the first page's cursor (the first page is not requested again)
+    params['cursor'] = data.get('message', {}).get('next-cursor', None)
+    while params['cursor'] and current_page < page_limit:
         current_page += 1
         print(f'Retrieving page {current_page} from CrossRef...\n')
-        data = retrieve_page_crossref(url, params)
+        data = await to_thread(retrieve_page_checkpointed, checkpoint, retrieve_page_crossref, url, params)
         next_cursor = data.get('message', {}).get('next-cursor', None)
 
         if not data['message']['items']:
             print('Finished retrieval.\n')
             break
 
-        all_data_crossref.extend(data['message']['items'])
+        await emit_records(data['message']['items'], all_data_crossref, on_page)
 
-        previous_cursor = next_cursor
         params['cursor'] = next_cursor
 
     return all_data_crossref
+# Synchronous wrapper for retrieve_crossref_async
+def retrieve_crossref(url, params, page_limit):
+    return run_async(retrieve_crossref_async(url, params, page_limit))
+# Streaming variant of retrieve_crossref (yields pages of records as they arrive)
+def iter_crossref(url, params, page_limit):
+    return stream_pages(retrieve_crossref_async, url, params, page_limit)
 # Retrieves results for specified journals in Crossref API
 def retrieve_all_journals(url_template, journal_list, params_crossref_journal, page_limit_crossref, retrieve_crossref_func):
     all_data = []
@@ -305,15 +1196,615 @@ def retrieve_all_journals(url_template, journal_list, params_crossref_journal, p
         all_data.extend(journal_data)
     return all_data
 
+# Retrieves single record by DOI from APIs with '{url}/{doi}' lookups (DataCite, Crossref)
+#failed lookups go to the dead-letter queue (except 404s, since the DOI is not registered there)
+def retrieve_doi(url, doi, checkpoint=None):
+    try:
+        response = http_get(f'{url}/{doi}')
+        if response.status_code == 200:
+            print(f'Retrieving {doi}\n')
+            resolve_dead_letter(get_cache_key(f'{url}/{doi}')[0])
+            return response.json()
+        print(f'Error retrieving {doi}: {response.status_code}, {response.text}')
+        if response.status_code == 404:
+            return None
+        error = f'{response.status_code}, {response.text[:200]}'
+    except requests.exceptions.RequestException as e:
+        print(f'Timeout error on DOI {doi}: {e}')
+        error = str(e)
+    record_dead_letter(f'{url}/{doi}', None, error, checkpoint, doi)
+    return None
+async def retrieve_doi_async(url, doi, checkpoint=None):
+    if checkpoint is not None and checkpoint.get(doi) is not None:
+        return checkpoint.get(doi)
+    result = await to_thread(retrieve_doi, url, doi, checkpoint)
+    if checkpoint is not None and result is not None:
+        checkpoint.add(doi, result)
+    return result
+# Retrieves records for list of DOIs with several lookups in flight (failed lookups are skipped, order is kept)
+async def retrieve_dois_async(url, dois, max_concurrency=1):
+    checkpoint = open_checkpoint('dois', url, retain=True)
+    results = await gather_limited([retrieve_doi_async(url, doi, checkpoint) for doi in dois], max_concurrency)
+    return [result for result in results if result is not None]
+# Synchronous wrapper for retrieve_dois_async
+def retrieve_dois(url, dois, max_concurrency=1):
+    return run_async(retrieve_dois_async(url, dois, max_concurrency))
+# Builds a DataCite search query matching any of the given DOIs (quoted, so DOI punctuation needs no escaping)
+def build_doi_query(dois):
+    quoted = ['"' + doi.replace('\\', '\\\\').replace('"', '\\"') + '"' for doi in dois]
+    return f'doi:({" OR ".join(quoted)})'
+# Retrieves DataCite records for list of DOIs by searching batch_size DOIs per request (several batches in flight); DOIs not returned by the search are looked up individually
+#returns the same {'data': record} objects as retrieve_dois, in input order
+async def retrieve_dois_batched_async(url, dois, batch_size=100, max_concurrency=1):
+    unique_dois = list(dict.fromkeys(str(doi).strip().lower() for doi in dois if isinstance(doi, str) and doi.strip()))
+    batches = [unique_dois[i:i + batch_size] for i in range(0, len(unique_dois), batch_size)]
+    print(f'Retrieving {len(unique_dois)} DOIs from DataCite in {len(batches)} batches of up to {batch_size} ({max_concurrency} in parallel)...\n')
+    checkpoint = open_checkpoint('doi-batches', url)
+    pages = await gather_limited([
+        to_thread(retrieve_page_checkpointed, checkpoint, retrieve_page_datacite, url, {'query': build_doi_query(batch), 'page[size]': len(batch)})
+        for batch in batches
+    ], max_concurrency)
+
+    found = {}
+    for page in pages:
+        for record in page.get('data', []):
+            doi = (record.get('attributes', {}).get('doi') or record.get('id') or '').lower()
+            found[doi] = {'data': record}
+
+    missing = [doi for doi in unique_dois if doi not in found]
+    if missing:
+        print(f'{len(missing)} DOIs not returned by batch search; retrieving individually.\n')
+        for result in await retrieve_dois_async(url, missing, max_concurrency):
+            doi = (result.get('data', {}).get('attributes', {}).get('doi') or result.get('data', {}).get('id') or '').lower()
+            found[doi] = result
+    return [found[doi] for doi in unique_dois if doi in found]
+# Synchronous wrapper for retrieve_dois_batched_async
+def retrieve_dois_batched(url, dois, batch_size=100, max_concurrency=1):
+    return run_async(retrieve_dois_batched_async(url, dois, batch_size, max_concurrency))
+
+# Default lifetimes of cached DOI existence results in days (deposits may be registered later, so negative results expire sooner)
+PROBE_TTL_POSITIVE = 90
+PROBE_TTL_NEGATIVE = 7
+
+# Removes resolver prefixes ('https://doi.org/', 'doi:') from a DOI
+def strip_doi_prefix(doi):
+    return re.sub(r'^(https?://(dx\.)?doi\.org/|doi:)', '', str(doi).strip(), flags=re.IGNORECASE)
+# Checks whether a DOI is registered from the resolver's own response (redirect = registered, 404 = not registered) without following redirects; None if undetermined
+def probe_doi(doi):
+    try:
+        response = http_head(f'https://doi.org/{doi}', allow_redirects=False)
+    except requests.RequestException as e:
+        print(f'Error checking {doi}: {e}')
+        return None
+    if response.status_code == 200 or 300 <= response.status_code < 400:
+        return True
+    if response.status_code in (404, 410):
+        return False
+    return None
+# Checks whether a DOI exists in the Handle System, which all registration agencies use (responseCode 1 = found, 100 = not found); None if undetermined
+def check_handle(doi):
+    try:
+        response = http_get(f'https://doi.org/api/handles/{doi}', params={'type': 'URL'})
+        code = response.json().get('responseCode')
+    except (requests.RequestException, ValueError) as e:
+        print(f'Error checking handle {doi}: {e}')
+        record_dead_letter(f'https://doi.org/api/handles/{doi}', {'type': 'URL'}, e)
+        return None
+    if code == 1:
+        return True
+    if code == 100:
+        return False
+    return None
+# Checks which DOIs exist by asking the registries directly: batched DataCite and Crossref searches, then the Handle API for DOIs neither returned
+async def check_registries_async(dois, url_datacite, url_crossref, batch_size=100, max_concurrency=1):
+    results = {}
+    remaining = list(dois)
+    ##a batch whose request failed says nothing about its DOIs: they are left undetermined (None) rather than passed on as missing, and the request is kept in the dead-letter queue
+    def mark_failed(url, params, batch, error):
+        record_dead_letter(url, params, error)
+        results.update(dict.fromkeys(batch))
+
+    ##DataCite: DOIs matched by search query (only the DOI attribute is returned)
+    batches = [remaining[i:i + batch_size] for i in range(0, len(remaining), batch_size)]
+    params = [{'query': build_doi_query(batch), 'page[size]': len(batch), 'fields[dois]': 'doi', 'disable-facets': 'true'} for batch in batches]
+    pages = await gather_limited([to_thread(retrieve_page_datacite, url_datacite, page_params) for page_params in params], max_concurrency)
+    for batch, page_params, page in zip(batches, params, pages):
+        if 'error' in page:
+            mark_failed(url_datacite, page_params, batch, page['error'])
+        for record in page.get('data', []):
+            results[(record.get('attributes', {}).get('doi') or record.get('id') or '').lower()] = True
+    remaining = [doi for doi in remaining if doi not in results]
+
+    ##Crossref: repeated 'doi' filters are combined with OR (kept shorter to limit URL length)
+    crossref_batch_size = min(batch_size, 50)
+    batches = [remaining[i:i + crossref_batch_size] for i in range(0, len(remaining), crossref_batch_size)]
+    params = [{'filter': ','.join(f'doi:{doi}' for doi in batch), 'rows': len(batch), 'select': 'DOI'} for batch in batches]
+    pages = await gather_limited([to_thread(retrieve_page_crossref, url_crossref, page_params) for page_params in params], max_concurrency)
+    for batch, page_params, page in zip(batches, params, pages):
+        if 'error' in page:
+            mark_failed(url_crossref, page_params, batch, page['error'])
+        for record in page.get('message', {}).get('items', []):
+            results[record.get('DOI', '').lower()] = True
+    remaining = [doi for doi in remaining if doi not in results]
+
+    unknown = sum(exists is None for exists in results.values())
+    print(f'{len(results) - unknown} DOIs found in DataCite or Crossref, {unknown} undetermined (failed batches); checking {len(remaining)} with the Handle API...\n')
+    for doi, exists in zip(remaining, await gather_limited([to_thread(check_handle, doi) for doi in remaining], max_concurrency)):
+        results[doi] = exists
+    return results
+# Loads DOI probe results that are still within their TTL ({doi: [exists, checked]}, later lines win)
+def load_probe_cache(path, ttl_positive=PROBE_TTL_POSITIVE, ttl_negative=PROBE_TTL_NEGATIVE):
+    cache = {}
+    try:
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    doi, exists, checked = json.loads(line)
+                except ValueError:
+                    continue
+                cache[doi] = [exists, checked]
+    except OSError:
+        return cache
+    now = time.time()
+    return {doi: entry for doi, entry in cache.items() if now - entry[1] < (ttl_positive if entry[0] else ttl_negative) * 86400}
+# Checks which DOIs are registered, several at a time, answering from the persistent result cache where possible; returns booleans in input order (None where no check could determine it)
+#backend 'resolver' asks doi.org for each DOI; 'registry' asks DataCite and Crossref in batches (registry_urls) and the Handle API for the rest
+async def probe_dois_async(dois, cache_path=None, max_concurrency=1, ttl_positive=PROBE_TTL_POSITIVE, ttl_negative=PROBE_TTL_NEGATIVE, backend='resolver', registry_urls=None, batch_size=100):
+    keys = [strip_doi_prefix(doi).lower() for doi in dois]
+    cache = load_probe_cache(cache_path, ttl_positive, ttl_negative) if cache_path else {}
+    to_probe = [doi for doi in dict.fromkeys(keys) if doi and doi not in cache]
+    source = 'DataCite/Crossref registries' if backend == 'registry' else 'doi.org'
+    print(f'{len(set(keys)) - len(to_probe)} DOIs answered from cache; checking {len(to_probe)} with {source} ({max_concurrency} in parallel)...\n')
+
+    log = None
+    if cache_path:
+        Path(cache_path).parent.mkdir(parents=True, exist_ok=True)
+        log = open(cache_path, 'a', encoding='utf-8')
+    def record(doi, exists):
+        ##undetermined results (server errors) are not cached, so they are checked again next time
+        if exists is not None:
+            cache[doi] = [exists, time.time()]
+            if log:
+                log.write(json.dumps([doi, exists, cache[doi][1]]) + '\n')
+                log.flush()
+    async def probe(doi):
+        record(doi, await to_thread(probe_doi, doi))
+    try:
+        if backend == 'registry':
+            for doi, exists in (await check_registries_async(to_probe, *registry_urls, batch_size, max_concurrency)).items():
+                record(doi, exists)
+        else:
+            await gather_limited([probe(doi) for doi in to_probe], max_concurrency)
+    finally:
+        if log:
+            log.close()
+
+    ##rewriting the cache drops expired and superseded entries
+    if cache_path:
+        temp_path = Path(cache_path).with_name(f'{Path(cache_path).name}.tmp')
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            for doi, (exists, checked) in cache.items():
+                f.write(json.dumps([doi, exists, checked]) + '\n')
+        os.replace(temp_path, cache_path)
+    ##DOIs whose checks failed are reported as unknown (None), not as missing
+    return [cache[doi][0] if doi in cache else (None if doi else False) for doi in keys]
+# Synchronous wrapper for probe_dois_async
+def probe_dois(dois, cache_path=None, max_concurrency=1, ttl_positive=PROBE_TTL_POSITIVE, ttl_negative=PROBE_TTL_NEGATIVE, backend='resolver', registry_urls=None, batch_size=100):
+    return run_async(probe_dois_async(dois, cache_path, max_concurrency, ttl_positive, ttl_negative, backend, registry_urls, batch_size))
+
+### Typed decoding ###
+#with the optional msgspec package installed, pages from the main harvest sources are decoded against schemas of the fields the workflow reads; all other fields are skipped while parsing instead of being built into dicts
+#records are still handed on as plain dicts (holding only those fields), so checkpoints, snapshots, and the record functions work the same with or without it
+
+# Fields read from each source's pages: None keeps a value as decoded, a dict keeps only the listed keys of an object, and a one-element list applies its spec to every element of an array
+DECODING_SPECS = {
+    'datacite': {
+        'data': [{'id': None, 'type': None, 'attributes': dict.fromkeys(DATACITE_FIELDS)}],
+        'links': None,
+        'meta': None
+    },
+    'dryad': {
+        '_embedded': {'stash:datasets': [dict.fromkeys(['id', 'identifier', 'publicationDate', 'lastModificationDate', 'title', 'authors', 'relatedWorks'])]},
+        'total': None
+    },
+    'dataverse': {
+        'data': {
+            'items': [dict.fromkeys(['global_id', 'versionState', 'published_at', 'name', 'authors', 'contacts', 'type', 'name_of_dataverse'])],
+            'total_count': None
+        }
+    },
+    'zenodo': {
+        'hits': {
+            'hits': [{
+                **dict.fromkeys(['id', 'doi', 'conceptdoi', 'conceptrecid', 'updated']),
+                'metadata': dict.fromkeys(['publication_date', 'title', 'description', 'creators', 'relatedWorks'])
+            }],
+            'total': None
+        },
+        'links': None
+    }
+}
+
+_decoders = {}
+
+# Builds the msgspec type for a field spec (objects become TypedDicts of the listed keys, so they decode straight into dicts and keys missing from a payload stay missing)
+def build_decoding_type(name, spec):
+    if spec is None:
+        return object
+    if isinstance(spec, list):
+        return list[build_decoding_type(name, spec[0])] | None
+    fields = {key: build_decoding_type(f'{name}_{i}', subspec) for i, (key, subspec) in enumerate(spec.items())}
+    return TypedDict(name, fields, total=False) | None
+# Enables typed decoding of harvest pages (only takes effect when msgspec is installed)
+def configure_decoding(enabled=True):
+    _decoders.clear()
+    if not enabled:
+        return False
+    if msgspec is None:
+        print('Typed decoding is on but msgspec is not installed; using standard JSON decoding.\n')
+        return False
+    for source, spec in DECODING_SPECS.items():
+        _decoders[source] = msgspec.json.Decoder(build_decoding_type(source, spec))
+    return True
+# Decodes a response body, through the source's schema when typed decoding is enabled (bodies that do not fit the schema are decoded as usual)
+def decode_response(response, source=None):
+    decoder = _decoders.get(source)
+    if decoder is None:
+        return response.json()
+    try:
+        return decoder.decode(response.content)
+    except msgspec.DecodeError:
+        return response.json()
+
+### Incremental harvesting ###
+#each source keeps a snapshot of its raw records and a watermark (date of the latest 'updated' value seen); later runs only request records changed since then
+
+# Per-source query filter for records changed since a date, record key, and last-modified value
+INCREMENTAL_SOURCES = {
+    'datacite': {
+        'filter': lambda params, since: {**params, 'query': f'({params["query"]}) AND updated:[{since} TO *]'},
+        'key': lambda item: (item.get('attributes', {}).get('doi') or item.get('id') or '').lower(),
+        'updated': lambda item: item.get('attributes', {}).get('updated')
+    },
+    'dryad': {
+        'filter': lambda params, since: {**params, 'modifiedSince': f'{since}T00:00:00Z'},
+        'key': lambda item: (item.get('identifier') or str(item.get('id', ''))).lower(),
+        'updated': lambda item: item.get('lastModificationDate')
+    },
+    'zenodo': {
+        'filter': lambda params, since: {**params, 'q': f'({params["q"]}) AND updated:[{since} TO *]'},
+        'key': lambda item: (item.get('doi') or str(item.get('id', ''))).lower(),
+        'updated': lambda item: item.get('updated')
+    }
+}
+#paging parameters do not change which records a query returns
+SNAPSHOT_IGNORED_PARAMS = {'page', 'page[cursor]', 'page[size]', 'per_page', 'size', 'start'}
+
+# Identifies the query a snapshot was built from (credentials and paging removed), so a changed query triggers a full harvest
+def get_query_fingerprint(url, params):
+    return get_cache_key(url, {key: value for key, value in params.items() if key not in SNAPSHOT_IGNORED_PARAMS})[0]
+# Returns the path of a source's snapshot file
+def get_snapshot_path(state_dir, source):
+    return Path(state_dir) / f'{source}-snapshot.json.gz'
+# Loads a source's snapshot if it was built from the same query, otherwise returns None
+def load_snapshot(state_dir, source, fingerprint):
+    path = get_snapshot_path(state_dir, source)
+    try:
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            snapshot = json.load(f)
+    except (OSError, ValueError, EOFError):
+        return None
+    if snapshot.get('fingerprint') != fingerprint or not snapshot.get('watermark'):
+        print(f'Saved {source} snapshot was built from a different query.\n')
+        return None
+    return snapshot
+# Saves a source's raw records and watermark (written to a temporary file and renamed)
+def save_snapshot(state_dir, source, fingerprint, records, watermark):
+    path = get_snapshot_path(state_dir, source)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = path.with_name(f'{path.name}.tmp')
+    with gzip.open(temp_path, 'wt', encoding='utf-8') as f:
+        json.dump({'fingerprint': fingerprint, 'watermark': watermark, 'saved': time.strftime('%Y-%m-%dT%H:%M:%S'), 'records': records}, f)
+    os.replace(temp_path, path)
+# Merges changed records into previous records by key (changed versions replace older ones, new records are appended)
+def merge_records(previous, changed, key_func):
+    merged = {key_func(item): item for item in previous}
+    for item in changed:
+        merged[key_func(item)] = item
+    return list(merged.values())
+# Returns the date (YYYY-MM-DD) of the most recent modification among records
+def get_watermark(records, updated_func):
+    dates = [str(updated_func(item))[:10] for item in records if updated_func(item)]
+    return max(dates) if dates else None
+# Retrieves a source incrementally: records changed since the snapshot's watermark are requested with retrieve_func(params) and merged into the snapshot by DOI
+def retrieve_incremental(state_dir, source, url, params, retrieve_func):
+    definition = INCREMENTAL_SOURCES[source]
+    fingerprint = get_query_fingerprint(url, params)
+    snapshot = load_snapshot(state_dir, source, fingerprint)
+    if snapshot is None:
+        print(f'Running full {source} harvest (snapshot will be saved for incremental runs).\n')
+        records = retrieve_func(params)
+        watermark = get_watermark(records, definition['updated'])
+    else:
+        ##the watermark day is requested again (range is inclusive), duplicates are resolved by the merge
+        print(f'Incremental {source} harvest: requesting records updated since {snapshot["watermark"]} (snapshot has {len(snapshot["records"])} records).\n')
+        changed = retrieve_func(definition['filter'](params, snapshot['watermark']))
+        records = merge_records(snapshot['records'], changed, definition['key'])
+        watermark = max(filter(None, [snapshot['watermark'], get_watermark(changed, definition['updated'])]))
+        print(f'{len(changed)} changed {source} records merged; {len(records)} records in snapshot.\n')
+    if records:
+        save_snapshot(state_dir, source, fingerprint, records, watermark)
+    return records
+
+### Record selection ###
+#fields kept from the records of each repository API for cross-validation against DataCite (applied page by page while the harvest is still running)
+
+# Selects fields from a Dryad API record
+def select_dryad_record(item):
+    authors_dr = item.get('authors', [{}])
+    related_works_list_dr = [rel.get('identifier', None) for rel in item.get('relatedWorks', [{}])]
+    return {
+        'doi': item.get('identifier', None),
+        'publication_date': item.get('publicationDate', ''),
+        'title': item.get('title', [{}]),
+        'first_author_first': authors_dr[0].get('firstName', None),
+        'last_author_first': authors_dr[-1].get('firstName', None),
+        'first_author_last': authors_dr[0].get('lastName', None),
+        'last_author_last': authors_dr[-1].get('lastName', None),
+        'first_affiliation': authors_dr[0].get('affiliation', None),
+        'last_affiliation': authors_dr[-1].get('affiliation', None),
+        'related_works': related_works_list_dr if related_works_list_dr else None
+    }
+# Selects fields from a Dataverse Search API record
+def select_dataverse_record(item):
+    contacts_dataverse = item.get('contacts', [{}])
+    return {
+        'doi': item.get('global_id', ''),
+        'status': item.get('versionState', None),
+        'publication_date': item.get('published_at', ''),
+        'title': item.get('name', None),
+        'authors': item.get('authors', [{}]),
+        'contacts': contacts_dataverse,
+        'first_contact': contacts_dataverse[0].get('name', None),
+        'first_contact_affiliation': contacts_dataverse[0].get('affiliation', None),
+        'last_contact': contacts_dataverse[-1].get('name', None),
+        'last_contact_affiliation': contacts_dataverse[-1].get('affiliation', None),
+        'type': item.get('type', None),
+        'dataverse': item.get('name_of_dataverse', None)
+    }
+# Selects fields from a Zenodo API record
+def select_zenodo_record(item):
+    metadata = item.get('metadata', {})
+    creators_zen = metadata.get('creators', [{}])
+    related_works_list_zen = [name.get('identifier', None) for name in metadata.get('relatedWorks', [{}])]
+    related_works_type_list_zen = [name.get('relation', None) for name in metadata.get('relatedWorks', [{}])]
+    return {
+        'doi': item.get('conceptdoi', None), #want parent to avoid de-duplication issues later
+        'publication_date': metadata.get('publication_date', ''),
+        'title': metadata.get('title', ''),
+        'description': metadata.get('description', None),
+        'first_author': creators_zen[0].get('name', None),
+        'last_author': creators_zen[-1].get('name', None),
+        'first_affiliation': creators_zen[0].get('affiliation', None),
+        'last_affiliation': creators_zen[-1].get('affiliation', None),
+        'related_works': related_works_list_zen if related_works_list_zen else None,
+        'related_works_type': related_works_type_list_zen if related_works_type_list_zen else None
+    }
+
+### DataCite record extraction ###
+#one pass over DataCite records, appending each field straight into its column (no per-record dicts or json_normalize)
+
+# Columns produced by extract_datacite_records, in output order
+DATACITE_COLUMNS = [
+    'doi', 'state', 'publisher', 'publisher_original', 'publication_year', 'publication_date', 'title',
+    'first_author', 'last_author', 'first_affiliation', 'last_affiliation',
+    'creators_names', 'creators_affiliations', 'creators_formatted',
+    'contributors_names', 'contributors_affiliations', 'contributors_formatted',
+    'relation_type', 'related_identifier', 'container_identifier', 'type', 'subjects',
+    'deposit_size', 'formats', 'file_count', 'rights', 'rights_code', 'views', 'downloads', 'citations', 'source'
+]
+NON_DIGITS = re.compile(r'\D')
+
+# Returns names, affiliation names, 'Name (Affiliation, ...)' strings, and one '; '-joined affiliation string per person for a list of DataCite creators or contributors
+#affiliations are objects when queried with affiliation=true and plain strings otherwise; both are read
+def summarize_people(people):
+    names = []
+    affiliations = []
+    formatted = []
+    grouped = []
+    for person in people:
+        name = person.get('name', '')
+        names.append(name)
+        person_affiliations = person.get('affiliation', [])
+        if isinstance(person_affiliations, list):
+            grouped.append('; '.join(affil.get('name', '') if isinstance(affil, dict) else affil for affil in person_affiliations if isinstance(affil, (dict, str))))
+        else:
+            person_affiliations = []
+        updated_affiliations = []
+        for affil in person_affiliations:
+            affil_name = affil.get('name', '') if isinstance(affil, dict) else affil
+            affiliations.append(affil_name)
+            updated_affiliations.append('University of Texas at Austin' if 'Austin' in affil_name else affil_name)
+        affil_str = ', '.join(updated_affiliations) if updated_affiliations else 'No affiliation listed'
+        formatted.append(f'{(name or "").strip()} ({affil_str})')
+    return names, affiliations, formatted, grouped
+# Builds a dataframe with DATACITE_COLUMNS from DataCite records (list or stream of 'data' objects), reading each record once
+#relation_type and related_identifier come from the last related identifier; explode_related instead gives one row per related identifier (records without any are left out) plus 'related_identifier_type', with contributors_affiliations holding one '; '-joined string per contributor
+#the number of records read is kept in df.attrs['records']
+def extract_datacite_records(records, source='DataCite', explode_related=False):
+    columns = DATACITE_COLUMNS + ['related_identifier_type'] if explode_related else DATACITE_COLUMNS
+    buffers = {column: [] for column in columns}
+    appends = [buffers[column].append for column in columns]
+    count = 0
+    for item in records:
+        count += 1
+        attributes = item.get('attributes', {})
+        publisher = attributes.get('publisher', '')
+        registered = attributes.get('registered', '')
+        ##registered is an ISO timestamp (e.g., 2021-03-04T17:05:12Z), so its first ten characters are the date
+        publication_date = date.fromisoformat(registered[:10]) if registered else None
+        titles = attributes.get('titles', [{}])
+        creators = attributes.get('creators', [{}])
+        creators_names, creators_affiliations, creators_formatted, _ = summarize_people(creators)
+        contributors_names, contributors_affiliations, contributors_formatted, contributors_grouped = summarize_people(attributes.get('contributors', [{}]))
+        ##the exploded (Figshare workflow 1) layout keeps one affiliation string per contributor
+        if explode_related:
+            contributors_affiliations = contributors_grouped
+        subject_list = [subj.get('subject', '').strip() for subj in attributes.get('subjects', []) if subj.get('subject')]
+        cleaned_sizes = [int(digits) for digits in (NON_DIGITS.sub('', size) for size in attributes.get('sizes', [])) if digits]
+        formats_list = attributes.get('formats', [])
+        rights_list = attributes.get('rightsList', [])
+        related_identifiers = attributes.get('relatedIdentifiers', [])
+        last_related = related_identifiers[-1] if related_identifiers else {}
+        values = [
+            attributes.get('doi', None),
+            attributes.get('state', None),
+            publisher,
+            publisher,
+            publication_date.year if publication_date else None,
+            publication_date,
+            titles[0].get('title', '') if titles else '',
+            creators[0].get('name', None) if creators else None,
+            creators[-1].get('name', None) if creators else None,
+            creators_affiliations[0] if creators_affiliations else None,
+            creators_affiliations[-1] if creators_affiliations else None,
+            creators_names,
+            creators_affiliations,
+            creators_formatted,
+            contributors_names,
+            contributors_affiliations,
+            contributors_formatted,
+            last_related.get('relationType', None),
+            last_related.get('relatedIdentifier', None),
+            (attributes.get('container') or {}).get('identifier', None),
+            attributes.get('types', {}).get('resourceTypeGeneral', ''),
+            '; '.join(subject_list) if subject_list else 'No keywords provided',
+            sum(cleaned_sizes) if cleaned_sizes else 'No file size information',
+            set(formats_list) if formats_list else 'No file information',
+            len(formats_list) if formats_list else 'No file information',
+            [right['rights'] for right in rights_list if 'rights' in right] or ['Rights unspecified'],
+            [right['rightsIdentifier'] for right in rights_list if 'rightsIdentifier' in right] or ['Unknown'],
+            attributes.get('viewCount', 0),
+            attributes.get('downloadCount', 0),
+            attributes.get('citationCount', 0),
+            source
+        ]
+        if not explode_related:
+            for append, value in zip(appends, values):
+                append(value)
+            continue
+        for rel in related_identifiers:
+            ##relation_type and related_identifier
+            values[17:19] = [rel.get('relationType'), rel.get('relatedIdentifier')]
+            for append, value in zip(appends, values + [rel.get('relatedIdentifierType')]):
+                append(value)
+    df = pd.DataFrame(buffers, columns=columns)
+    df.attrs['records'] = count
+    return df
+
 ### Metadata cleaning / assessment functions ###
 
+# Evaluates func once per distinct value of a Series (or distinct row of a DataFrame's columns) and maps the results back to every row
+##rows are passed to func as dicts keyed by column, so row-wise helpers (row['col'], row.get('col')) work unchanged; values must be hashable
+def map_unique(values, func):
+    if isinstance(values, pd.DataFrame):
+        columns = list(values.columns)
+        keys = pd.Series(list(zip(*(values[column] for column in columns))), index=values.index, dtype=object)
+        codes, uniques = pd.factorize(keys, use_na_sentinel=False)
+        results = [func(dict(zip(columns, key))) for key in uniques]
+    else:
+        codes, uniques = pd.factorize(values, use_na_sentinel=False)
+        results = [func(value) for value in uniques]
+    return pd.Series(pd.Series(results, dtype=object).to_numpy()[codes], index=values.index).infer_objects()
+
+# Builds a regex matching any of the given strings from their character trie (shared prefixes are tested once; the longest string wins)
+def trie_pattern(words):
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = True
+
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+        return f'(?:{body})?' if '' in node else body
+
+    return build(trie)
+
+# Finds institution permutations (env['PERMUTATIONS']) in strings with one compiled pattern instead of one scan per permutation
+##the longest permutation starting at a position wins; shorter ones starting there are its prefixes
+class AffiliationMatcher:
+    def __init__(self, permutations):
+        self.permutations = list(dict.fromkeys(permutations))
+        self.rank = {perm: i for i, perm in enumerate(self.permutations)}
+        ##case-insensitive hits are reported as the first listed permutation with the same spelling
+        self.folded = {}
+        for perm in self.permutations:
+            self.folded.setdefault(perm.lower(), perm)
+        self.pattern = re.compile(trie_pattern(self.permutations))
+        self.pattern_ci = re.compile(trie_pattern(self.folded), re.IGNORECASE)
+        self.prefixes = {perm: [other for other in self.permutations if perm.startswith(other)] for perm in self.permutations}
+        self.whole_words = {perm: re.compile(fr'\b{re.escape(perm)}\b') for perm in self.permutations}
+
+    # Returns (permutation, position) of the leftmost hit, or None
+    def search(self, text, case=False):
+        if not isinstance(text, str):
+            return None
+        match = (self.pattern if case else self.pattern_ci).search(text)
+        if match is None:
+            return None
+        found = match.group()
+        return (found if case else self.folded.get(found.lower(), found)), match.start()
+
+    # Checks whether any permutation occurs in the text
+    def contains(self, text, case=False):
+        return isinstance(text, str) and (self.pattern if case else self.pattern_ci).search(text) is not None
+
+    # Keeps the strings in a list that contain a permutation
+    def filter(self, values, case=False):
+        if not isinstance(values, list):
+            return []
+        search = (self.pattern if case else self.pattern_ci).search
+        return [value for value in values if isinstance(value, str) and search(value)]
+
+    # Returns every (permutation, position) hit in the text, overlapping hits included (case-sensitive)
+    def find_all(self, text):
+        hits = []
+        if not isinstance(text, str):
+            return hits
+        ##resumes one character after each hit so that permutations inside it (e.g., 'UT Austin') are also reported
+        match = self.pattern.search(text)
+        while match is not None:
+            hits.extend((perm, match.start()) for perm in self.prefixes[match.group()])
+            match = self.pattern.search(text, match.start() + 1)
+        return hits
+
+    # Returns the earliest-listed permutation found in a string or list of strings (case-sensitive), or None
+    ##whole_word only counts hits bounded by \b on both sides
+    def first_permutation(self, values, whole_word=False):
+        if isinstance(values, str):
+            values = [values]
+        elif not isinstance(values, list):
+            return None
+        found = set()
+        for value in values:
+            hits = {perm for perm, _ in self.find_all(value)}
+            if whole_word:
+                hits = {perm for perm in hits if self.whole_words[perm].search(value)}
+            found.update(hits)
+        return min(found, key=self.rank.get) if found else None
+
 # Determines which author (first vs. last or both) is affiliated
-def determine_affiliation(row, ut_variations):
+def determine_affiliation(row, matcher):
     if row['first_author'] == row['last_author']:
         return 'single author'
 
-    first_affiliated = any(variation in (row['first_affiliation'] if isinstance(row['first_affiliation'], str) else '') for variation in ut_variations)
-    last_affiliated = any(variation in (row['last_affiliation'] if isinstance(row['last_affiliation'], str) else '') for variation in ut_variations)
+    first_affiliated = matcher.contains(row['first_affiliation'], case=True)
+    last_affiliated = matcher.contains(row['last_affiliation'], case=True)
 
     if first_affiliated and last_affiliated:
         return 'both lead and senior'
@@ -324,6 +1815,119 @@ def determine_affiliation(row, ut_variations):
     else:
         return 'neither lead nor senior'
 
+# Labels each row with the first source column holding a permutation (case-insensitive) and the permutation itself
+##permutation: an entry equal to a permutation first, otherwise a whole-word hit (earliest-listed permutation in both cases)
+##list columns are exploded once and every distinct string is matched once, then reduced back to rows
+def detect_affiliations(df, matcher, sources):
+    entries = pd.concat([df[column].reset_index(drop=True).explode().dropna().to_frame('entry').assign(priority=priority)
+        for priority, column in enumerate(sources)])
+    entries = entries[entries['entry'].map(lambda entry: isinstance(entry, str)).astype(bool)]
+    codes, uniques = pd.factorize(entries['entry'])
+    unranked = len(matcher.permutations)
+    hits = pd.Series([matcher.contains(value) for value in uniques], dtype=bool)
+    exact = pd.Series([matcher.rank.get(value, unranked) for value in uniques], dtype='int64')
+    whole_word = pd.Series([matcher.rank.get(matcher.first_permutation(value, whole_word=True), unranked) for value in uniques], dtype='int64')
+    entries['hit'] = hits.to_numpy()[codes]
+    entries['exact'] = exact.to_numpy()[codes]
+    entries['whole_word'] = whole_word.to_numpy()[codes]
+
+    labels = list(sources.values())
+    rows = pd.RangeIndex(len(df))
+    first_source = entries[entries['hit']].groupby(level=0)['priority'].min().reindex(rows)
+    source = [labels[int(priority)] if pd.notna(priority) else None for priority in first_source]
+    ranks = entries.groupby(level=0)[['exact', 'whole_word']].min().reindex(rows, fill_value=unranked)
+    best = ranks['exact'].where(ranks['exact'] < unranked, ranks['whole_word'])
+    permutation = [matcher.permutations[rank] if rank < unranked else None for rank in best]
+    return pd.DataFrame({'affiliation_source': source, 'affiliation_permutation': permutation}, index=df.index, dtype=object)
+
+# Built-in repository categories derived from the (standardized) publisher name; the first matching rule sets the label
+##override or extend with a REPOSITORY_CATEGORIES object of the same shape in env.json
+REPOSITORY_CATEGORIES = {
+    'non_TDR_IR': {
+        'rules': [{'pattern': 'University|UCLA|UNC|Harvard|Princeton|Johns Hopkins|Caltech|CUHK|Wyoming|Yale|ASU Library|Dataverse|DaRUS', 'case': True, 'label': 'non-TDR institutional'}],
+        'default': 'not university or TDR'
+    },
+    'US_federal': {
+        'rules': [{'pattern': 'NOAA|NIH|NSF|U.S.|DOE|DOD|DOI|National Laboratory|Designsafe|MSD-Live', 'case': True, 'label': 'Federal US repo'}],
+        'default': 'not federal US repo'
+    },
+    'GREI': {
+        'rules': [{'pattern': 'Dryad|figshare|Harvard|Zenodo|Vivli|Mendeley|Open Science Framework', 'case': False, 'label': 'GREI member'}],
+        'default': 'not GREI member'
+    },
+    'scope': {
+        'rules': [
+            {'pattern': 'Dryad|figshare|Zenodo|Mendeley|Open Science Framework|Science Data Bank', 'case': False, 'label': 'Generalist'},
+            {'pattern': 'ASU Library|Boise State|Borealis|Caltech|CUHK|Dataverse|Oregon|Princeton|University|Wyoming|DaRUS|Texas|Institut Laue-Langevin|Jagiellonian|Hopkins|Purdue|Yale|GRO.data|DR-NTU|CUAHSI', 'case': False, 'label': 'Institutional'}
+        ],
+        'default': 'Specialist'
+    }
+}
+
+# Compiles a rule's pattern (rules use the REPOSITORY_MAPPING keys 'pattern' and 'case')
+def compile_rule(rule):
+    return re.compile(rule['pattern'], 0 if rule.get('case', True) else re.IGNORECASE)
+
+# Standardizes publisher names and derives repository categories in one pass over the distinct publishers
+##renames follow env['REPOSITORY_MAPPING'] in order (later rules see earlier replacements); rules on another column (e.g., 'doi')
+##are evaluated per row once and become part of the lookup key, optionally restricted to publishers matching rule['publisher']
+class RepositoryClassifier:
+    def __init__(self, renames=(), categories=None):
+        self.renames = [{**rule, 'regex': compile_rule(rule), 'condition': re.compile(rule['publisher']) if rule.get('publisher') else None} for rule in renames]
+        self.row_rules = [rule for rule in self.renames if rule['column'] != 'publisher']
+        self.categories = {
+            column: ([(compile_rule(rule), rule['label']) for rule in spec['rules']], spec.get('default'))
+            for column, spec in (REPOSITORY_CATEGORIES if categories is None else categories).items()
+        }
+
+    # Classifies one (publisher, row-rule hits...) key
+    def classify_key(self, key):
+        publisher = key['publisher']
+        row_hits = iter(key['hits'])
+        for rule in self.renames:
+            if rule['column'] == 'publisher':
+                matched = isinstance(publisher, str) and rule['regex'].search(publisher) is not None
+            else:
+                matched = next(row_hits)
+            if matched and (rule['condition'] is None or (isinstance(publisher, str) and rule['condition'].search(publisher))):
+                publisher = rule['replacement']
+        result = {'publisher': publisher}
+        for column, (rules, default) in self.categories.items():
+            result[column] = next((label for regex, label in rules if isinstance(publisher, str) and regex.search(publisher)), default)
+        return result
+
+    # Returns a dataframe (same index) with the standardized 'publisher' and one column per category
+    def classify(self, df):
+        hits = [df[rule['column']].map(lambda value, regex=rule['regex']: isinstance(value, str) and regex.search(value) is not None) for rule in self.row_rules]
+        keys = pd.DataFrame({'publisher': df['publisher'], 'hits': list(zip(*hits)) if hits else [()] * len(df)}, index=df.index)
+        results = map_unique(keys, self.classify_key)
+        return pd.DataFrame(results.tolist(), index=df.index, columns=['publisher', *self.categories])
+
+# License standardization rules (case-sensitive patterns searched in the rendered 'rights' text) in precedence order
+##when several rules match, the LAST one wins, as each rule overrides those above it
+LICENSE_RULES = [
+    ('Creative Commons Zero|CC0', 'CC0'),
+    ('Creative Commons Attribution Non Commercial Share Alike', 'CC BY-NC-SA'),
+    ('Creative Commons Attribution Non Commercial', 'CC BY-NC'),
+    ('Creative Commons Attribution 3.0|Creative Commons Attribution 4.0|Creative Commons Attribution-NonCommercial', 'CC BY'),
+    ('GNU General Public License', 'GNU GPL'),
+    ('Apache License', 'Apache'),
+    ('MIT License', 'MIT'),
+    ('BSD', 'BSD'),
+    ('ODC-BY', 'ODC-BY'),
+    ('Open Access', 'Rights unclear'),
+    ('Closed Access', 'Restricted access'),
+    ('Restricted Access', 'Restricted access'),
+    ('Databrary', 'Custom terms'),
+    ('UCAR', 'Custom terms'),
+    (r'\A\Z', 'Rights unclear')
+]
+
+# Maps rendered 'rights' strings to standardized licenses (each distinct value is matched once)
+def standardize_rights(rights, rules=LICENSE_RULES, default='Rights unclear'):
+    compiled = [(re.compile(pattern), label) for pattern, label in reversed(rules)]
+    return map_unique(rights, lambda text: next((label for regex, label in compiled if isinstance(text, str) and regex.search(text)), default))
+
 # Standard function to look for file with specified pattern in name in specified directory
 def load_most_recent_file(outputs_dir, pattern):
     files = os.listdir(outputs_dir)
@@ -347,39 +1951,32 @@ def load_most_recent_file(outputs_dir, pattern):
 # Checks if hypothetical DOI exists (for PLOS SI workflow)
 def check_link(doi):
     url = f'https://doi.org/{doi}'
-    response = requests.head(url, allow_redirects=True)
+    response = http_head(url, allow_redirects=True)
     return response.status_code == 200
 
-# Counts descriptive words in text field
-def count_words(text, nondescriptive_words):
-    if not isinstance(text, str) or text.strip() == '':
-        return 0, 0
-    words = text.split()
-    total_words = len(words)
-    descriptive_count = sum(1 for word in words if word.lower() not in nondescriptive_words)
-    return total_words, descriptive_count
-
-## Adjust for specific phrases in descriptive word counting
-def adjust_descriptive_count(row):
-    title = row.get('title_reformatted')
-    desc_count = row.get('descriptive_word_count_title', 0)
-    
-    if not isinstance(title, str):
-        return desc_count
-    if not isinstance(desc_count, int):
-        try:
-            desc_count = int(desc_count)
-        except (ValueError, TypeError):
-            desc_count = 0
-
-    keywords = [
-        'supplemental material',
-        'supplementary material',
-        'supplementary materials',
-        'supplemental materials',
-        'supporting materials'
-    ]
-
-    if any(keyword in title.lower() for keyword in keywords):
-        return max(0, desc_count - 1)
-    return desc_count
\ No newline at end of file
+# Whole-number tokens 1-999999 count as nondescriptive (matched by pattern rather than listed in the vocabulary)
+NUMERIC_TOKEN = re.compile(r'[1-9][0-9]{0,5}')
+# Phrases that mark a title as supplementary material (one descriptive word is discounted)
+SUPPLEMENTAL_PHRASES = ['supplemental material', 'supplementary material', 'supplementary materials', 'supplemental materials', 'supporting materials']
+
+# Counts total, descriptive, and nondescriptive words per title for a whole column at once
+##titles are split on whitespace; tokens are compared lowercased against nondescriptive_words, and each distinct token is classified once
+def score_titles(titles, nondescriptive_words):
+    index = titles.index
+    titles = titles.reset_index(drop=True).astype(object)
+    tokens = titles.where(titles.map(lambda title: isinstance(title, str)).astype(bool)).str.split().explode().dropna()
+    codes, vocabulary = pd.factorize(tokens.str.lower())
+    nondescriptive = pd.Series([token in nondescriptive_words or NUMERIC_TOKEN.fullmatch(token) is not None for token in vocabulary], dtype=bool)
+    descriptive = pd.Series(~nondescriptive.to_numpy()[codes], index=tokens.index, dtype=bool)
+
+    rows = pd.RangeIndex(len(titles))
+    total = descriptive.groupby(level=0).size().reindex(rows, fill_value=0)
+    descriptive_count = descriptive.groupby(level=0).sum().reindex(rows, fill_value=0)
+    ##supplementary-material titles lose one descriptive word
+    supplemental = titles.str.lower().str.contains('|'.join(re.escape(phrase) for phrase in SUPPLEMENTAL_PHRASES), na=False).astype(bool)
+    descriptive_count = (descriptive_count - supplemental.astype('int64')).clip(lower=0)
+    return pd.DataFrame({
+        'total_word_count_title': total.to_numpy(dtype='int64'),
+        'descriptive_word_count_title': descriptive_count.to_numpy(dtype='int64'),
+        'nondescriptive_word_count_title': (total - descriptive_count).to_numpy(dtype='int64')
+    }, index=index)
\ No newline at end of file